@@ -308,7 +308,7 @@ def visual_search(q: str, k: int = 8):
     clip = get_clip_embedder()
 
     # Embed text query into CLIP space
-    query_vec = np.array(clip.embed_text(q))
+    query_vec = clip.embed_text(q).astype(np.float32)
     query_vec = query_vec / np.linalg.norm(query_vec)
 
     # Cosine similarity against all image embeddings
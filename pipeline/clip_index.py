@@ -116,13 +116,14 @@ def build_index(top_k: int = 5):
     embed_time = time.time() - t0
     print(f"  Embedded in {embed_time:.1f}s ({len(images) / embed_time:.1f} img/sec)")
 
-    image_vecs = np.array(image_embeddings)
+    # float16 from CLIP; similarities are computed in float32
+    image_vecs = image_embeddings.astype(np.float32)
 
     # Embed category descriptions
     print(f"\n[3/3] Auto-tagging against {len(F1_CATEGORIES)} F1 categories...")
     t0 = time.time()
     category_embeddings = clip.embed_texts(F1_CATEGORIES)
-    cat_vecs = np.array(category_embeddings)
+    cat_vecs = category_embeddings.astype(np.float32)
 
     # Compute similarities and build index
     index_data = {
@@ -13,67 +13,499 @@ Addresses all issues identified in the data quality audit:
 
 Usage:
     python pipeline/data_quality_fixes.py
+    python pipeline/data_quality_fixes.py --serial
+    python pipeline/data_quality_fixes.py --build-telemetry-cache
+    python pipeline/data_quality_fixes.py --migrate-telemetry-zstd
+    python pipeline/data_quality_fixes.py --create-profile-merge-index
 """
 
 from __future__ import annotations
 
-import gzip
+import argparse
+import functools
+import multiprocessing
+import os
 import pickle
+import re
 import warnings
+import zlib
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timezone
+from pathlib import Path
 
 import numpy as np
 import pandas as pd
-from pymongo import UpdateOne
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.collection import Collection
 from pymongo.database import Database
+from pymongo.errors import DuplicateKeyError
 
 from updater._db import get_db
 
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
 warnings.filterwarnings("ignore")
 
+# Local columnar copy of telemetry_compressed, one Parquet file per filename
+TELEMETRY_CACHE_DIR = Path(__file__).resolve().parent / "output" / "telemetry_cache"
+TELEMETRY_CACHE_ROW_GROUP = 200_000
+# Parquet schema metadata recording the telemetry_compressed chunks a cache file was built from
+CACHE_META_CHUNKS = b"source_chunks"
+CACHE_META_MAX_CHUNK = b"source_max_chunk"
 
-def load_telemetry_from_mongo(
+# zstd re-encoding of telemetry_compressed (see migrate_telemetry_to_zstd)
+TELEMETRY_ZSTD_COLLECTION = "telemetry_zstd"
+
+
+def parallel_bulk_write(
+    coll: Collection,
+    ops: list,
+    chunk_size: int = 1000,
+    workers: int = 4,
+) -> int:
+    """Unordered bulk_write split into chunk_size batches sent from a thread pool.
+
+    The driver releases the GIL while waiting on the socket, so threads are
+    enough to keep several batches in flight. Returns the total modified_count.
+    """
+    batches = [ops[i:i + chunk_size] for i in range(0, len(ops), chunk_size)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda batch: coll.bulk_write(batch, ordered=False), batches)
+        return sum(r.modified_count for r in results)
+
+
+def _decode_chunk(
+    raw: bytes,
+    columns: list[str] | None = None,
+    codec: str = "gzip",
+) -> pd.DataFrame | None:
+    """Decompress and unpickle one telemetry chunk, keeping only `columns`.
+
+    Module-level so it can be shipped to ProcessPoolExecutor workers. gzip
+    blobs are inflated with zlib directly to skip the GzipFile wrapper
+    overhead; codec="zstd" reads blobs written by migrate_telemetry_to_zstd.
+
+    Every chunk is one whole pickled DataFrame, so there is nothing to gain
+    from splicing several pickles into a single pickle.loads() call (that
+    only pays off for many small Python-object pickles); chunks are decoded
+    individually and in parallel instead.
+    """
+    try:
+        if codec == "zstd":
+            df = pickle.loads(zstandard.ZstdDecompressor().decompress(raw))
+        else:
+            df = pickle.loads(zlib.decompress(raw, 16 + zlib.MAX_WBITS))
+    except Exception:
+        return None
+    if columns:
+        available = [c for c in columns if c in df.columns]
+        df = df[available]
+    return df
+
+
+def ensure_telemetry_index(db: Database) -> None:
+    """Create the telemetry_compressed (filename, chunk) index.
+
+    It backs the filename distinct in _telemetry_filenames and the per-file
+    chunk queries sorted by chunk. Built by the write paths and main(), not
+    by the read helpers, which may run in many workers at once.
+    """
+    db["telemetry_compressed"].create_index([("filename", 1), ("chunk", 1)])
+
+
+def _telemetry_filenames(db: Database, session_filter: str | None) -> list[str]:
+    query = {"filename": {"$regex": f"_{re.escape(session_filter)}\\."}} if session_filter else {}
+    return sorted(db["telemetry_compressed"].distinct("filename", query))
+
+
+def _chunk_stats(db: Database, collection: str, filenames: list[str]) -> dict[str, tuple[int, int]]:
+    """(chunk count, max chunk) per filename in `collection`.
+
+    Only filename and chunk are projected, so the (filename, chunk) index
+    covers the query. A file without chunk numbers reports max chunk -1.
+    """
+    pipeline = [
+        {"$match": {"filename": {"$in": filenames}}},
+        {"$project": {"_id": 0, "filename": 1, "chunk": 1}},
+        {"$group": {"_id": "$filename", "n": {"$sum": 1}, "max_chunk": {"$max": "$chunk"}}},
+    ]
+    return {
+        d["_id"]: (d["n"], -1 if d["max_chunk"] is None else int(d["max_chunk"]))
+        for d in db[collection].aggregate(pipeline)
+    }
+
+
+def _cache_stats(path: Path) -> tuple[int, int] | None:
+    """Source (chunk count, max chunk) recorded in a cached Parquet file, if any."""
+    try:
+        meta = pq.read_schema(path).metadata or {}
+        return int(meta[CACHE_META_CHUNKS]), int(meta[CACHE_META_MAX_CHUNK])
+    except (OSError, KeyError, ValueError, pa.ArrowInvalid):
+        return None
+
+
+def _fresh_cache_files(
+    db: Database,
+    filenames: list[str],
+    cache_dir: Path,
+    warn: bool = True,
+) -> set[str]:
+    """Filenames whose Parquet cache still matches telemetry_compressed.
+
+    A cached file is current only if the chunk count and max chunk it was
+    built from equal the collection's now; otherwise chunks were added or
+    removed since and the file is read from Mongo instead.
+    """
+    if not PYARROW_AVAILABLE:
+        return set()
+    cached = {f: Path(cache_dir) / f for f in filenames if (Path(cache_dir) / f).exists()}
+    if not cached:
+        return set()
+    source = _chunk_stats(db, "telemetry_compressed", list(cached))
+    fresh = {f for f, path in cached.items() if _cache_stats(path) == source.get(f)}
+    stale = sorted(set(cached) - fresh)
+    if stale and warn:
+        print(f"  ⚠ Telemetry cache out of date for {len(stale)} file(s), reading them from MongoDB "
+              f"(rebuild with --build-telemetry-cache): {', '.join(stale)}")
+    return fresh
+
+
+def _current_zstd_files(db: Database, filenames: list[str]) -> set[str]:
+    """Filenames whose telemetry_zstd copy has the same chunks as telemetry_compressed."""
+    if not ZSTD_AVAILABLE or not filenames:
+        return set()
+    zstd = _chunk_stats(db, TELEMETRY_ZSTD_COLLECTION, filenames)
+    if not zstd:
+        return set()
+    source = _chunk_stats(db, "telemetry_compressed", list(zstd))
+    return {f for f, stats in zstd.items() if source.get(f) == stats}
+
+
+def _iter_parquet_cache(path: Path, columns: list[str] | None = None) -> Iterator[pd.DataFrame]:
+    """Yield row-group batches of a cached telemetry file, reading only `columns`."""
+    pf = pq.ParquetFile(path)
+    if columns:
+        columns = [c for c in columns if c in pf.schema_arrow.names]
+    for batch in pf.iter_batches(batch_size=TELEMETRY_CACHE_ROW_GROUP, columns=columns):
+        yield batch.to_pandas()
+
+
+def iter_telemetry_from_mongo(
     db: Database,
     session_filter: str = "R",
     columns: list[str] | None = None,
-) -> pd.DataFrame:
-    """Load telemetry from telemetry_compressed (gzip'd pickle chunks in MongoDB).
+    workers: int | None = None,
+    cache_dir: Path = TELEMETRY_CACHE_DIR,
+) -> Iterator[pd.DataFrame]:
+    """Yield telemetry from telemetry_compressed one chunk at a time.
 
     Each document is a gzip-compressed pickle of a DataFrame chunk.
-    Chunks are grouped by filename (e.g. '2018_R.parquet').
+    Chunks are grouped by filename (e.g. '2018_R.parquet') and yielded
+    in (filename, chunk) order, so callers can aggregate incrementally
+    without holding the whole corpus in memory.
+
+    Files present and up to date in the Parquet cache (see
+    build_telemetry_parquet_cache) are read from there with column
+    projection instead of decoding the Mongo blobs. Files whose chunks in
+    telemetry_zstd match telemetry_compressed are read from the zstd copy
+    instead of the gzip one. Decoding is CPU-bound,
+    so chunks are decompressed/unpickled on a process pool (`workers`
+    defaults to os.cpu_count()) while the cursor keeps pulling; at most
+    2 × workers chunks are in flight at once.
     """
     # Only load race files if session_filter is set
-    filenames = sorted(db["telemetry_compressed"].distinct("filename"))
-    if session_filter:
-        filenames = [f for f in filenames if f"_{session_filter}." in f]
+    filenames = _telemetry_filenames(db, session_filter)
+    fresh_cache = _fresh_cache_files(db, filenames, cache_dir)
+    zstd_files = _current_zstd_files(db, [f for f in filenames if f not in fresh_cache])
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = 2 * workers
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for fname in filenames:
+            if fname in fresh_cache:
+                yield from _iter_parquet_cache(Path(cache_dir) / fname, columns)
+                continue
+
+            if fname in zstd_files:
+                source, codec = TELEMETRY_ZSTD_COLLECTION, "zstd"
+            else:
+                source, codec = "telemetry_compressed", "gzip"
+            # Batches sized to the decode window, so the cursor holds no more
+            # compressed blobs than the pool is about to take
+            cursor = db[source].find(
+                {"filename": fname},
+                {"data": 1, "chunk": 1, "_id": 0},
+            ).sort("chunk", 1).batch_size(max_in_flight)
+
+            pending: deque = deque()
+            for doc in cursor:
+                pending.append(executor.submit(_decode_chunk, doc["data"], columns, codec))
+                if len(pending) >= max_in_flight:
+                    df = pending.popleft().result()
+                    if df is not None:
+                        yield df
+
+            while pending:
+                df = pending.popleft().result()
+                if df is not None:
+                    yield df
+
+
+def build_telemetry_parquet_cache(
+    db: Database,
+    out_dir: Path = TELEMETRY_CACHE_DIR,
+    session_filter: str | None = None,
+) -> int:
+    """Materialise telemetry_compressed as one ZSTD Parquet file per filename.
+
+    The Mongo blobs stay as cold storage; later runs of
+    iter_telemetry_from_mongo() read only the columns they need from the
+    cache. Each file records the chunk count and max chunk it was built
+    from, so files whose source has changed since are rebuilt and current
+    ones skipped. Returns the number of files written.
+    """
+    if not PYARROW_AVAILABLE:
+        raise ValueError(
+            "pyarrow not installed. Run:\n"
+            "  pip install pyarrow"
+        )
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    ensure_telemetry_index(db)
 
-    frames = []
+    filenames = _telemetry_filenames(db, session_filter)
+    fresh = _fresh_cache_files(db, filenames, out_dir, warn=False)
+
+    written = 0
     for fname in filenames:
-        chunks = list(db["telemetry_compressed"].find(
+        if fname in fresh:
+            continue
+        cursor = db["telemetry_compressed"].find(
             {"filename": fname},
             {"data": 1, "chunk": 1, "_id": 0},
-        ))
-        chunks.sort(key=lambda d: d.get("chunk", 0))
-
-        for doc in chunks:
-            try:
-                df = pickle.loads(gzip.decompress(doc["data"]))
-                if columns:
-                    available = [c for c in columns if c in df.columns]
-                    df = df[available]
+        ).sort("chunk", 1)
+        n_chunks, max_chunk, frames = 0, -1, []
+        for doc in cursor:
+            n_chunks += 1
+            if doc.get("chunk") is not None:
+                max_chunk = max(max_chunk, int(doc["chunk"]))
+            df = _decode_chunk(doc["data"])
+            if df is not None:
                 frames.append(df)
-            except Exception:
-                pass
+        if not frames:
+            continue
+
+        table = pa.Table.from_pandas(pd.concat(frames, ignore_index=True), preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            CACHE_META_CHUNKS: str(n_chunks).encode(),
+            CACHE_META_MAX_CHUNK: str(max_chunk).encode(),
+        })
+        tmp_path = out_dir / f"{fname}.tmp"
+        pq.write_table(table, tmp_path, compression="zstd", row_group_size=TELEMETRY_CACHE_ROW_GROUP)
+        tmp_path.replace(out_dir / fname)
+        written += 1
+        print(f"  ✅ {fname}: {table.num_rows:,} rows cached")
+
+    return written
+
+
+def load_telemetry_from_mongo(
+    db: Database,
+    session_filter: str = "R",
+    columns: list[str] | None = None,
+    cache_dir: Path = TELEMETRY_CACHE_DIR,
+) -> pd.DataFrame:
+    """Load telemetry from telemetry_compressed into a single DataFrame.
 
+    When every matching file is current in the Parquet cache, they are scanned as
+    one pyarrow dataset (projected columns only, multi-threaded) and
+    converted to pandas once; decoded Mongo chunks are likewise concatenated
+    as Arrow tables when pyarrow is installed. Prefer iter_telemetry_from_mongo() when the
+    consumer can aggregate chunk by chunk.
+    """
+    filenames = _telemetry_filenames(db, session_filter)
+    cached = [Path(cache_dir) / f for f in filenames]
+    if cached and len(_fresh_cache_files(db, filenames, cache_dir, warn=False)) == len(filenames):
+        try:
+            # A dataset takes its schema from the first file unless told
+            # otherwise, which would drop columns that only later files have
+            schema = pa.unify_schemas([pq.read_schema(p) for p in cached])
+            dataset = ds.dataset([str(p) for p in cached], schema=schema, format="parquet")
+            if columns:
+                columns = [c for c in columns if c in dataset.schema.names]
+            return dataset.to_table(columns=columns).to_pandas()
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Files with conflicting column types go through the per-file reader
+            pass
+
+    frames = iter_telemetry_from_mongo(db, session_filter, columns, cache_dir=cache_dir)
+    if PYARROW_AVAILABLE:
+        return _concat_via_arrow(frames)
+    frames = list(frames)
     if not frames:
         return pd.DataFrame()
     return pd.concat(frames, ignore_index=True)
 
 
+def _concat_via_arrow(frames: Iterator[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate decoded chunks as Arrow tables and convert to pandas once.
+
+    Each chunk is converted as it arrives so its pandas copy can be freed,
+    the tables are concatenated without copying, and self_destruct releases
+    the Arrow buffers column by column during the final conversion. Chunks
+    that Arrow can't represent or unify fall back to pd.concat.
+    """
+    tables: list = []
+    leftovers: list[pd.DataFrame] = []
+    for df in frames:
+        if not leftovers:
+            try:
+                tables.append(pa.Table.from_pandas(df, preserve_index=False))
+                continue
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                pass
+        leftovers.append(df)
+
+    if not tables and not leftovers:
+        return pd.DataFrame()
+    if not leftovers:
+        try:
+            table = pa.concat_tables(tables, promote_options="default")
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass
+        else:
+            del tables
+            return table.to_pandas(split_blocks=True, self_destruct=True)
+    return pd.concat([t.to_pandas() for t in tables] + leftovers, ignore_index=True)
+
+
+def migrate_telemetry_to_zstd(db: Database, level: int = 3, batch_size: int = 50) -> int:
+    """Re-encode telemetry_compressed into telemetry_zstd.
+
+    Each chunk is re-pickled with protocol 5 and compressed with zstd, which
+    decompresses several times faster than gzip on these numeric frames.
+    telemetry_compressed is left in place and stays the source of truth.
+
+    The migration is incremental: only files whose chunk count or max chunk
+    differ between the two collections are re-encoded, so it can be rerun
+    after ingestion adds chunks. Until it is, iter_telemetry_from_mongo()
+    reads those files from telemetry_compressed; anything that writes to
+    telemetry_compressed should rerun this to keep the zstd copy in sync.
+    Chunks that fail to decode are copied unchanged so the chunk counts
+    still line up; they decode to nothing from either collection. Returns
+    the number of chunks written.
+    """
+    if not ZSTD_AVAILABLE:
+        raise ValueError(
+            "zstandard not installed. Run:\n"
+            "  pip install zstandard"
+        )
+
+    ensure_telemetry_index(db)
+    target = db[TELEMETRY_ZSTD_COLLECTION]
+    target.create_index([("filename", 1), ("chunk", 1)], unique=True)
+    compressor = zstandard.ZstdCompressor(level=level)
+
+    filenames = _telemetry_filenames(db, None)
+    stale = [f for f in filenames if f not in _current_zstd_files(db, filenames)]
+
+    written = 0
+    for fname in stale:
+        target.delete_many({"filename": fname})
+        ops = []
+        for doc in db["telemetry_compressed"].find({"filename": fname}, {"_id": 0}):
+            df = _decode_chunk(doc["data"])
+            if df is not None:
+                doc["data"] = compressor.compress(pickle.dumps(df, protocol=5))
+            doc["codec"] = "zstd"
+            ops.append(ReplaceOne(
+                {"filename": fname, "chunk": doc.get("chunk", 0)},
+                doc, upsert=True,
+            ))
+            if len(ops) >= batch_size:
+                target.bulk_write(ops, ordered=False)
+                written += len(ops)
+                ops = []
+
+        if ops:
+            target.bulk_write(ops, ordered=False)
+            written += len(ops)
+    return written
+
+
+@functools.cache
+def load_driver_number_map(db: Database) -> dict[str, str]:
+    """Map driver number (str) → three-letter code using openf1_drivers.
+
+    Read once per database per process and shared by the stages and
+    scripts that need it; callers must not mutate the returned dict.
+    """
+    num_to_code: dict[str, str] = {}
+    for doc in db["openf1_drivers"].find({}, {"driver_number": 1, "name_acronym": 1, "_id": 0}):
+        num_to_code[str(doc["driver_number"])] = doc["name_acronym"]
+    return num_to_code
+
+
+def map_driver_numbers(drivers: pd.Series, num_to_code: dict[str, str]) -> pd.Series:
+    """Driver numbers → acronyms as a categorical Series; unknown numbers → NaN.
+
+    Only the distinct numbers are looked up in num_to_code; every row then
+    takes its category code through one NumPy gather instead of a dict
+    lookup per row. Numbers sharing an acronym share a category.
+    """
+    number_idx, numbers = pd.factorize(drivers)
+    mapped = pd.Categorical([num_to_code.get(str(n)) for n in numbers])
+    codes = np.where(number_idx >= 0, mapped.codes[number_idx], -1)
+    return pd.Series(
+        pd.Categorical.from_codes(codes, categories=mapped.categories),
+        index=drivers.index, name=drivers.name,
+    )
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # 1. FIX BRAKING G VALUES
 # ══════════════════════════════════════════════════════════════════════════════
 
+def _braking_g_samples(tel: pd.DataFrame) -> tuple[pd.Series, pd.Series, pd.DataFrame]:
+    """Per-driver row counts, braking-sample counts and valid g samples for one chunk."""
+    # One sort + grouped diff instead of a filter/sort per driver
+    tel = tel.sort_values(["Driver", "SessionTime"], ignore_index=True)
+    grp = tel.groupby("Driver", sort=False)
+
+    dt = grp["SessionTime"].diff()
+    # Convert km/h to m/s: divide by 3.6
+    dv_ms = grp["Speed"].diff() / 3.6
+
+    # Only braking samples: brake active AND decelerating
+    braking_mask = (tel["Brake"] == True) & (dv_ms < 0) & (dt > 0)
+
+    # Instantaneous deceleration in g, computed once and only for braking
+    # rows; the same series feeds the headline stats and the lap windows
+    g = (dv_ms[braking_mask].abs() / dt[braking_mask]) / 9.81
+    # Filter obvious sensor noise (> 8g is unrealistic even for F1)
+    g = g[(g > 0.1) & (g < 8)]
+
+    samples = tel.loc[g.index, ["Driver", "LapNumber"]].assign(g=g)
+    return grp.size(), braking_mask.groupby(tel["Driver"]).sum(), samples
+
+
 def fix_braking_g(db: Database) -> int:
     """Recompute braking G from telemetry_compressed with correct unit conversion.
 
@@ -83,73 +515,65 @@ def fix_braking_g(db: Database) -> int:
     print("\n[1/7] Fixing braking G values...")
 
     # Build driver number → code mapping
-    num_to_code = {}
-    for doc in db["openf1_drivers"].find({}, {"driver_number": 1, "name_acronym": 1, "_id": 0}):
-        num_to_code[str(doc["driver_number"])] = doc["name_acronym"]
-
-    # Load race telemetry from MongoDB
-    tel_df = load_telemetry_from_mongo(
-        db, session_filter="R",
-        columns=["Driver", "Speed", "Brake", "SessionTime", "Session", "LapNumber"],
-    )
-
-    if tel_df.empty:
-        print("  ⚠ No telemetry data found in telemetry_compressed, skipping braking G fix")
-        return 0
-
-    tel_df["Driver"] = tel_df["Driver"].map(num_to_code)
-    tel_df = tel_df.dropna(subset=["Driver"])
-    print(f"  Loaded {len(tel_df):,} race telemetry rows")
+    num_to_code = load_driver_number_map(db)
 
     # Get all drivers from opponent_profiles
-    all_drivers = [
+    all_drivers = {
         d["driver_code"]
         for d in db["opponent_profiles"].find({}, {"driver_code": 1, "_id": 0})
         if d.get("driver_code")
-    ]
+    }
 
-    ops = []
-    for driver_code in sorted(all_drivers):
-        drv = tel_df[tel_df["Driver"] == driver_code].copy()
-        if drv.empty or len(drv) < 10:
+    # Stream race telemetry from MongoDB, keeping only mergeable per-driver
+    # partials (row counts, braking counts, braking g samples) between chunks
+    row_counts = pd.Series(dtype="int64")
+    braking_counts = pd.Series(dtype="int64")
+    sample_frames = []
+    n_rows = 0
+    for chunk in iter_telemetry_from_mongo(
+        db, session_filter="R",
+        columns=["Driver", "Speed", "Brake", "SessionTime", "Session", "LapNumber"],
+    ):
+        chunk = chunk.assign(Driver=chunk["Driver"].map(num_to_code))
+        chunk = chunk[chunk["Driver"].isin(all_drivers)]
+        if chunk.empty:
             continue
+        n_rows += len(chunk)
 
-        drv = drv.sort_values("SessionTime").reset_index(drop=True)
+        rows, braking, samples = _braking_g_samples(chunk)
+        row_counts = row_counts.add(rows, fill_value=0)
+        braking_counts = braking_counts.add(braking, fill_value=0)
+        sample_frames.append(samples)
 
-        # Compute instantaneous deceleration in g
-        dt = drv["SessionTime"].diff()
-        dv_kmh = drv["Speed"].diff()
-        # Convert km/h to m/s: divide by 3.6
-        dv_ms = dv_kmh / 3.6
-
-        # Only braking samples: brake active AND decelerating
-        braking_mask = (drv["Brake"] == True) & (dv_ms < 0) & (dt > 0)
-        if braking_mask.sum() < 5:
-            continue
-
-        g_values = (dv_ms[braking_mask].abs() / dt[braking_mask]) / 9.81
-        # Filter obvious sensor noise (> 8g is unrealistic even for F1)
-        g_values = g_values[(g_values > 0.1) & (g_values < 8)]
+    if not n_rows:
+        print("  ⚠ No telemetry data found in telemetry_compressed, skipping braking G fix")
+        return 0
+    print(f"  Streamed {n_rows:,} race telemetry rows")
 
-        if g_values.empty:
-            continue
+    eligible = row_counts.index[
+        (row_counts >= 10) & (braking_counts.reindex(row_counts.index) >= 5)
+    ]
+    b = pd.concat(sample_frames, ignore_index=True)
+    b = b[b["Driver"].isin(eligible)]
 
-        # Late-race braking delta: laps 40+ vs laps 1-20
-        drv_braking = drv.loc[braking_mask].copy()
-        drv_braking["g"] = (dv_ms[braking_mask].abs() / dt[braking_mask]) / 9.81
-        drv_braking = drv_braking[(drv_braking["g"] > 0.1) & (drv_braking["g"] < 8)]
+    stats = b.groupby("Driver")["g"].agg(
+        avg="mean", p99=lambda s: s.quantile(0.99), std="std",
+    )
 
-        early = drv_braking[drv_braking["LapNumber"].between(1, 20)]["g"]
-        late = drv_braking[drv_braking["LapNumber"] >= 40]["g"]
-        late_delta = None
-        if len(early) > 10 and len(late) > 10:
-            late_delta = round(float(late.mean() - early.mean()), 4)
+    # Late-race braking delta: laps 40+ vs laps 1-20
+    early = b.loc[b["LapNumber"].between(1, 20)].groupby("Driver")["g"].agg(["mean", "count"])
+    late = b.loc[b["LapNumber"] >= 40].groupby("Driver")["g"].agg(["mean", "count"])
+    enough = early["count"].gt(10) & late["count"].gt(10)
+    late_delta = (late["mean"] - early["mean"])[enough].dropna()
 
+    ops = []
+    for driver_code, row in stats.sort_index().iterrows():
+        delta = late_delta.get(driver_code)
         update = {
-            "avg_braking_g": round(float(g_values.mean()), 4),
-            "max_braking_g": round(float(g_values.quantile(0.99)), 4),
-            "g_consistency": round(float(g_values.std()), 4),
-            "late_race_braking_delta": late_delta,
+            "avg_braking_g": round(float(row["avg"]), 4),
+            "max_braking_g": round(float(row["p99"]), 4),
+            "g_consistency": round(float(row["std"]), 4),
+            "late_race_braking_delta": round(float(delta), 4) if delta is not None else None,
         }
 
         ops.append(UpdateOne(
@@ -158,8 +582,7 @@ def fix_braking_g(db: Database) -> int:
         ))
 
     if ops:
-        result = db["opponent_profiles"].bulk_write(ops, ordered=False)
-        count = result.modified_count
+        count = parallel_bulk_write(db["opponent_profiles"], ops)
         print(f"  ✅ Fixed braking G for {count} drivers")
         return count
 
@@ -171,89 +594,101 @@ def fix_braking_g(db: Database) -> int:
 # 2. DEDUPLICATE fastf1_laps AND fastf1_weather
 # ══════════════════════════════════════════════════════════════════════════════
 
-def deduplicate_fastf1(db: Database) -> dict[str, int]:
-    """Remove duplicate documents from fastf1_laps and fastf1_weather."""
-    print("\n[2/7] Deduplicating fastf1_laps and fastf1_weather...")
-    results = {}
+def _rebuild_without_duplicates(db: Database, name: str, key_fields: list[str]) -> int:
+    """Rebuild a collection keeping the first document (by _id) per key.
 
-    # --- fastf1_laps: key = (Year, Race, SessionType, Driver, LapNumber) ---
-    pipeline = [
-        {"$group": {
-            "_id": {
-                "Year": "$Year", "Race": "$Race", "SessionType": "$SessionType",
-                "Driver": "$Driver", "LapNumber": "$LapNumber",
-            },
-            "ids": {"$push": "$_id"},
-            "count": {"$sum": 1},
-        }},
-        {"$match": {"count": {"$gt": 1}}},
-    ]
-    dups = list(db["fastf1_laps"].aggregate(pipeline, allowDiskUse=True))
-    ids_to_delete = []
-    for group in dups:
-        # Keep the first, delete the rest
-        ids_to_delete.extend(group["ids"][1:])
-
-    if ids_to_delete:
-        # Delete in batches of 5000
-        for i in range(0, len(ids_to_delete), 5000):
-            batch = ids_to_delete[i:i + 5000]
-            db["fastf1_laps"].delete_many({"_id": {"$in": batch}})
-        results["fastf1_laps"] = len(ids_to_delete)
-        print(f"  ✅ Removed {len(ids_to_delete)} duplicate laps from {len(dups)} groups")
-    else:
-        results["fastf1_laps"] = 0
-        print("  ✅ No duplicate laps found")
+    Runs entirely server-side: a $group/$first aggregation writes the
+    deduplicated copy with $out, the original's indexes are recreated on
+    it, and it replaces the original via renameCollection. No ids travel
+    to the client. Returns the number of documents removed.
+    """
+    coll = db[name]
+    tmp_name = f"{name}_dedup"
+    before = coll.estimated_document_count()
 
-    # --- fastf1_weather: key = (Year, Race, SessionType, Time) ---
-    pipeline = [
+    coll.aggregate([
+        {"$sort": {"_id": 1}},
         {"$group": {
-            "_id": {
-                "Year": "$Year", "Race": "$Race",
-                "SessionType": "$SessionType", "Time": "$Time",
-            },
-            "ids": {"$push": "$_id"},
-            "count": {"$sum": 1},
+            "_id": {f: f"${f}" for f in key_fields},
+            "doc": {"$first": "$$ROOT"},
         }},
-        {"$match": {"count": {"$gt": 1}}},
-    ]
-    dups = list(db["fastf1_weather"].aggregate(pipeline, allowDiskUse=True))
-    ids_to_delete = []
-    for group in dups:
-        ids_to_delete.extend(group["ids"][1:])
-
-    if ids_to_delete:
-        for i in range(0, len(ids_to_delete), 5000):
-            batch = ids_to_delete[i:i + 5000]
-            db["fastf1_weather"].delete_many({"_id": {"$in": batch}})
-        results["fastf1_weather"] = len(ids_to_delete)
-        print(f"  ✅ Removed {len(ids_to_delete)} duplicate weather rows from {len(dups)} groups")
-    else:
-        results["fastf1_weather"] = 0
-        print("  ✅ No duplicate weather found")
+        {"$replaceRoot": {"newRoot": "$doc"}},
+        {"$out": tmp_name},
+    ], allowDiskUse=True)
+
+    tmp = db[tmp_name]
+    removed = before - tmp.estimated_document_count()
+    if removed <= 0:
+        tmp.drop()
+        return 0
+
+    for idx_name, info in coll.index_information().items():
+        if idx_name == "_id_":
+            continue
+        options = {k: v for k, v in info.items() if k not in ("key", "v", "ns")}
+        tmp.create_index(info["key"], name=idx_name, **options)
+    tmp.rename(name, dropTarget=True)
+    return removed
+
+
+def _ensure_unique_index(db: Database, name: str, key_fields: list[str]) -> int:
+    """Make key_fields a unique compound index, deduplicating only when needed.
+
+    An existing unique index already guarantees there is nothing to remove,
+    so the collection is not scanned at all. Otherwise the unique build is
+    attempted directly and the collection is rebuilt only if it fails on a
+    duplicate key. Returns the number of documents removed.
+    """
+    coll = db[name]
+    keys = [(f, 1) for f in key_fields]
+    idx_name = "_".join(f"{f}_1" for f in key_fields)
+
+    existing = coll.index_information().get(idx_name)
+    if existing and existing.get("unique"):
+        return 0
+    if existing:
+        coll.drop_index(idx_name)
+
+    try:
+        coll.create_index(keys, unique=True, background=True)
+        return 0
+    except DuplicateKeyError:
+        pass
+
+    removed = _rebuild_without_duplicates(db, name, key_fields)
+    coll.create_index(keys, unique=True, background=True)
+    return removed
+
+
+def deduplicate_fastf1(db: Database) -> dict[str, int]:
+    """Remove duplicate documents from fastf1_laps and fastf1_weather
+    and enforce their compound unique indexes."""
+    print("\n[2/7] Deduplicating fastf1_laps and fastf1_weather...")
+    results = {}
 
-    # Ensure proper compound indexes exist (drop non-unique first if needed)
-    laps_idx = "Year_1_Race_1_SessionType_1_Driver_1_LapNumber_1"
-    weather_idx = "Year_1_Race_1_SessionType_1_Time_1"
+    # --- fastf1_laps: key = (Year, Race, SessionType, Driver, LapNumber) ---
     try:
-        existing = db["fastf1_laps"].index_information()
-        if laps_idx in existing and not existing[laps_idx].get("unique"):
-            db["fastf1_laps"].drop_index(laps_idx)
-        db["fastf1_laps"].create_index(
-            [("Year", 1), ("Race", 1), ("SessionType", 1), ("Driver", 1), ("LapNumber", 1)],
-            unique=True, background=True,
+        removed = _ensure_unique_index(
+            db, "fastf1_laps", ["Year", "Race", "SessionType", "Driver", "LapNumber"],
         )
+        results["fastf1_laps"] = removed
+        if removed:
+            print(f"  ✅ Removed {removed} duplicate laps")
+        else:
+            print("  ✅ No duplicate laps found")
     except Exception as e:
         print(f"  ⚠ fastf1_laps index: {e}")
 
+    # --- fastf1_weather: key = (Year, Race, SessionType, Time) ---
     try:
-        existing = db["fastf1_weather"].index_information()
-        if weather_idx in existing and not existing[weather_idx].get("unique"):
-            db["fastf1_weather"].drop_index(weather_idx)
-        db["fastf1_weather"].create_index(
-            [("Year", 1), ("Race", 1), ("SessionType", 1), ("Time", 1)],
-            unique=True, background=True,
+        removed = _ensure_unique_index(
+            db, "fastf1_weather", ["Year", "Race", "SessionType", "Time"],
         )
+        results["fastf1_weather"] = removed
+        if removed:
+            print(f"  ✅ Removed {removed} duplicate weather rows")
+        else:
+            print("  ✅ No duplicate weather found")
     except Exception as e:
         print(f"  ⚠ fastf1_weather index: {e}")
 
@@ -305,74 +740,85 @@ def compute_missing_profile_fields(db: Database) -> int:
     - avg_positions_gained_lap1_to_5
     - avg_tyre_life
     - long_race_performance
+
+    Results are written with $merge when opponent_profiles has a unique
+    driver_code index (see create_profile_merge_index), else as bulk updates.
+    Returns the largest number of profiles that have one of these fields set.
     """
     print("\n[4/7] Computing missing opponent_profiles fields...")
 
-    drivers = list(db["opponent_profiles"].find(
-        {}, {"driver_code": 1, "_id": 0}
-    ))
-    driver_codes = [d["driver_code"] for d in drivers if d.get("driver_code")]
-
-    # --- avg_tyre_life: from fastf1_laps ---
-    tyre_life_pipeline = [
-        {"$match": {"SessionType": "R", "TyreLife": {"$ne": None}}},
+    profiles = db["opponent_profiles"]
+    mergeable = _has_profile_merge_key(db)
+    if not mergeable:
+        print("  ⚠ No unique opponent_profiles.driver_code index — writing via bulk updates "
+              "(create it with --create-profile-merge-index)")
+
+    # --- avg_tyre_life and long_race_performance in a single collection scan ---
+    # $avg skips nulls, so the early (laps 1-20) and late (laps 40+) stint
+    # means are conditional accumulators on the same $group as the tyre life.
+    # Expression comparisons order null below numbers, hence the type checks.
+    clean_lap = [
+        {"$isNumber": "$LapTime"}, {"$isNumber": "$LapNumber"},
+        {"$gt": ["$LapTime", 60]},
+    ]
+    laps_pipeline = [
+        {"$match": {"SessionType": "R"}},
+        {"$project": {"_id": 0, "Driver": 1, "LapNumber": 1, "LapTime": 1, "TyreLife": 1}},
         {"$group": {
             "_id": "$Driver",
             "avg_tyre_life": {"$avg": "$TyreLife"},
+            "early_avg": {"$avg": {"$cond": [
+                {"$and": [*clean_lap, {"$lte": ["$LapNumber", 20]}]},
+                {"$toDouble": "$LapTime"}, None,
+            ]}},
+            "late_avg": {"$avg": {"$cond": [
+                {"$and": [*clean_lap, {"$gte": ["$LapNumber", 40]}]},
+                {"$toDouble": "$LapTime"}, None,
+            ]}},
         }},
-    ]
-    tyre_results = {
-        r["_id"]: round(r["avg_tyre_life"], 2)
-        for r in db["fastf1_laps"].aggregate(tyre_life_pipeline, allowDiskUse=True)
-    }
-
-    # --- long_race_performance: late vs early stint lap time delta ---
-    # Use fastf1_laps: compare laps 40+ vs laps 1-20
-    long_race_pipeline_early = [
-        {"$match": {"SessionType": "R", "LapTime": {"$gt": 60}, "LapNumber": {"$lte": 20}}},
-        {"$group": {"_id": "$Driver", "early_avg": {"$avg": {"$toDouble": "$LapTime"}}}},
-    ]
-    long_race_pipeline_late = [
-        {"$match": {"SessionType": "R", "LapTime": {"$gt": 60}, "LapNumber": {"$gte": 40}}},
-        {"$group": {"_id": "$Driver", "late_avg": {"$avg": {"$toDouble": "$LapTime"}}}},
-    ]
-    early_map = {r["_id"]: r["early_avg"] for r in db["fastf1_laps"].aggregate(long_race_pipeline_early, allowDiskUse=True)}
-    late_map = {r["_id"]: r["late_avg"] for r in db["fastf1_laps"].aggregate(long_race_pipeline_late, allowDiskUse=True)}
-
-    long_race_map = {}
-    for drv in early_map:
-        if drv in late_map and early_map[drv] and late_map[drv]:
-            long_race_map[drv] = round(late_map[drv] - early_map[drv], 4)
-
-    # --- avg_position_lap1 and avg_positions_gained_lap1_to_5 ---
-    # Use openf1_position: get position at start vs lap 5
-    # We need session_key + driver_number, then map back to driver_code
-    code_to_num = {}
-    for doc in db["openf1_drivers"].find({}, {"driver_number": 1, "name_acronym": 1, "_id": 0}):
-        code_to_num[doc["name_acronym"]] = doc["driver_number"]
-    num_to_code = {v: k for k, v in code_to_num.items()}
-
-    # Get race session keys
-    race_sessions = list(db["openf1_sessions"].find(
-        {"session_type": "Race"},
-        {"session_key": 1, "_id": 0},
-    ))
-    race_session_keys = [s["session_key"] for s in race_sessions]
-
-    # Lap 1 positions from openf1_laps
-    lap1_pipeline = [
-        {"$match": {"session_key": {"$in": race_session_keys}, "lap_number": 1}},
-        {"$group": {
-            "_id": "$driver_number",
-            "positions": {"$push": "$duration_sector_1"},
-            "count": {"$sum": 1},
+        {"$project": {
+            "_id": 0,
+            "driver_code": "$_id",
+            "avg_tyre_life": {"$cond": [
+                {"$eq": ["$avg_tyre_life", None]}, "$$REMOVE",
+                {"$round": ["$avg_tyre_life", 2]},
+            ]},
+            # long_race_performance: late vs early stint lap time delta
+            "long_race_performance": {"$cond": [
+                {"$and": ["$early_avg", "$late_avg"]},
+                {"$round": [{"$subtract": ["$late_avg", "$early_avg"]}, 4]},
+                "$$REMOVE",
+            ]},
         }},
+        # $merge rejects documents without the "on" field
+        {"$match": {"driver_code": {"$ne": None}}},
+    ]
+    _merge_into_profiles(profiles, db["fastf1_laps"], laps_pipeline, mergeable)
+
+    # --- avg_position_lap1 ---
+    # Use openf1_position: earliest position per session per driver is the
+    # position at race start (grid → lap 1). driver_number is mapped back to
+    # driver_code server-side with the openf1_drivers map as a $switch of
+    # literals (a $getField with a computed field name needs MongoDB 7.2+).
+    num_to_code = load_driver_number_map(db)
+    driver_code_expr = {"$switch": {
+        "branches": [
+            {"case": {"$eq": [{"$toString": "$_id"}, {"$literal": num}]}, "then": {"$literal": code}}
+            for num, code in num_to_code.items()
+        ],
+        "default": None,
+    }} if num_to_code else {"$literal": None}
+
+    race_session_keys = [
+        s["session_key"] for s in db["openf1_sessions"].find(
+            {"session_type": "Race"},
+            {"session_key": 1, "_id": 0},
+        )
     ]
 
-    # Use openf1_position for actual positions — get earliest position per session per driver
-    # This is position at race start (grid → lap 1)
     position_lap1_pipeline = [
         {"$match": {"session_key": {"$in": race_session_keys}}},
+        {"$project": {"_id": 0, "session_key": 1, "driver_number": 1, "date": 1, "position": 1}},
         {"$sort": {"date": 1}},
         {"$group": {
             "_id": {"session_key": "$session_key", "driver_number": "$driver_number"},
@@ -382,94 +828,125 @@ def compute_missing_profile_fields(db: Database) -> int:
             "_id": "$_id.driver_number",
             "avg_position_lap1": {"$avg": "$first_position"},
         }},
-    ]
-    pos_lap1_results = list(db["openf1_position"].aggregate(position_lap1_pipeline, allowDiskUse=True))
-    pos_lap1_map = {}
-    for r in pos_lap1_results:
-        code = num_to_code.get(r["_id"])
-        if code:
-            pos_lap1_map[code] = round(r["avg_position_lap1"], 2)
-
-    # Positions gained lap 1 to 5: need position at start vs after ~5 laps
-    # Get position entries near lap 5 (use openf1_laps lap_number=5 position)
-    pos_lap5_pipeline = [
-        {"$match": {"session_key": {"$in": race_session_keys}, "lap_number": 5}},
-        {"$group": {
-            "_id": "$driver_number",
-            "sessions": {"$push": "$session_key"},
+        {"$project": {
+            "_id": 0,
+            "driver_code": driver_code_expr,
+            "avg_position_lap1": {"$round": ["$avg_position_lap1", 2]},
         }},
+        {"$match": {"driver_code": {"$ne": None}, "avg_position_lap1": {"$ne": None}}},
     ]
-
-    # Simpler: use openf1_position grouped by time bins
-    # Instead, compare grid position (from fastf1_laps) to position at lap 5
-    grid_pipeline = [
-        {"$match": {"SessionType": "R", "LapNumber": 1}},
-        {"$group": {
-            "_id": {"Driver": "$Driver", "Year": "$Year", "Race": "$Race"},
-            "grid_pos": {"$first": "$Position"},
+    _merge_into_profiles(profiles, db["openf1_position"], position_lap1_pipeline, mergeable)
+
+    # --- avg_positions_gained_lap1_to_5 ---
+    # Compare grid position (from fastf1_laps) to position at lap 5.
+    # Each lap-1 row is joined to the same driver's lap-5 row server-side
+    # (served by the unique Year/Race/SessionType/Driver/LapNumber index)
+    # and averaged per driver, so nothing comes back to the client.
+    gained_pipeline = [
+        {"$match": {"SessionType": "R", "LapNumber": 1, "Position": {"$ne": None}}},
+        {"$project": {"_id": 0, "Driver": 1, "Year": 1, "Race": 1, "Position": 1}},
+        {"$lookup": {
+            "from": "fastf1_laps",
+            "let": {"year": "$Year", "race": "$Race", "driver": "$Driver"},
+            "pipeline": [
+                {"$match": {"$expr": {"$and": [
+                    {"$eq": ["$Year", "$$year"]},
+                    {"$eq": ["$Race", "$$race"]},
+                    {"$eq": ["$SessionType", "R"]},
+                    {"$eq": ["$Driver", "$$driver"]},
+                    {"$eq": ["$LapNumber", 5]},
+                ]}}},
+                {"$project": {"_id": 0, "Position": 1}},
+                {"$limit": 1},
+            ],
+            "as": "lap5",
         }},
-    ]
-    grid_results = list(db["fastf1_laps"].aggregate(grid_pipeline, allowDiskUse=True))
-
-    lap5_pipeline = [
-        {"$match": {"SessionType": "R", "LapNumber": 5}},
+        {"$unwind": "$lap5"},
+        {"$match": {"lap5.Position": {"$ne": None}}},
         {"$group": {
-            "_id": {"Driver": "$Driver", "Year": "$Year", "Race": "$Race"},
-            "lap5_pos": {"$first": "$Position"},
+            "_id": "$Driver",
+            # positive = gained positions
+            "gained": {"$avg": {"$subtract": ["$Position", "$lap5.Position"]}},
         }},
+        {"$project": {
+            "_id": 0,
+            "driver_code": "$_id",
+            "avg_positions_gained_lap1_to_5": {"$round": [{"$toDouble": "$gained"}, 2]},
+        }},
+        {"$match": {"driver_code": {"$ne": None}}},
     ]
-    lap5_results = list(db["fastf1_laps"].aggregate(lap5_pipeline, allowDiskUse=True))
-
-    grid_map = {(r["_id"]["Driver"], r["_id"]["Year"], r["_id"]["Race"]): r["grid_pos"] for r in grid_results}
-    lap5_map = {(r["_id"]["Driver"], r["_id"]["Year"], r["_id"]["Race"]): r["lap5_pos"] for r in lap5_results}
-
-    # Compute per-driver average positions gained
-    gained_per_driver: dict[str, list[float]] = {}
-    for key, grid_pos in grid_map.items():
-        driver = key[0]
-        lap5_pos = lap5_map.get(key)
-        if grid_pos is not None and lap5_pos is not None:
-            gained = grid_pos - lap5_pos  # positive = gained positions
-            gained_per_driver.setdefault(driver, []).append(gained)
-
-    gained_map = {
-        drv: round(float(np.mean(vals)), 2)
-        for drv, vals in gained_per_driver.items()
-        if vals
+    _merge_into_profiles(profiles, db["fastf1_laps"], gained_pipeline, mergeable)
+
+    counts = {
+        field: profiles.count_documents({field: {"$ne": None}})
+        for field in (
+            "avg_tyre_life", "long_race_performance",
+            "avg_position_lap1", "avg_positions_gained_lap1_to_5",
+        )
     }
+    count = max(counts.values())
+    if count:
+        print(f"  ✅ {count} profiles populated")
+        for field, n in counts.items():
+            print(f"    {field}: {n} drivers")
+        return count
 
-    # --- Build updates ---
-    ops = []
-    for driver_code in driver_codes:
-        update = {}
+    print("  ⚠ No updates computed")
+    return 0
 
-        if driver_code in tyre_results:
-            update["avg_tyre_life"] = tyre_results[driver_code]
 
-        if driver_code in long_race_map:
-            update["long_race_performance"] = long_race_map[driver_code]
+def _has_profile_merge_key(db: Database) -> bool:
+    """Whether opponent_profiles has the unique driver_code index $merge needs."""
+    existing = db["opponent_profiles"].index_information().get("driver_code_1")
+    return bool(existing and existing.get("unique"))
 
-        if driver_code in pos_lap1_map:
-            update["avg_position_lap1"] = pos_lap1_map[driver_code]
 
-        if driver_code in gained_map:
-            update["avg_positions_gained_lap1_to_5"] = gained_map[driver_code]
+def create_profile_merge_index(db: Database) -> bool:
+    """Add a unique driver_code index to opponent_profiles.
 
-        if update:
-            ops.append(UpdateOne({"driver_code": driver_code}, {"$set": update}))
+    Lets compute_missing_profile_fields() write with $merge instead of bulk
+    updates. Run explicitly, since other writers to opponent_profiles then
+    cannot insert a second profile for a driver. Unlike the fastf1
+    collections, duplicate profiles are not removed here; returns False if
+    they (or a non-unique driver_code index) prevent the build.
+    """
+    coll = db["opponent_profiles"]
+    if _has_profile_merge_key(db):
+        return True
+    if "driver_code_1" in coll.index_information():
+        return False
+    try:
+        coll.create_index([("driver_code", 1)], unique=True, background=True)
+        return True
+    except DuplicateKeyError:
+        return False
 
-    if ops:
-        result = db["opponent_profiles"].bulk_write(ops, ordered=False)
-        count = result.modified_count
-        print(f"  ✅ Updated {count} profiles")
-        print(f"    avg_tyre_life: {len(tyre_results)} drivers")
-        print(f"    long_race_performance: {len(long_race_map)} drivers")
-        print(f"    avg_position_lap1: {len(pos_lap1_map)} drivers")
-        print(f"    avg_positions_gained_lap1_to_5: {len(gained_map)} drivers")
-        return count
 
-    print("  ⚠ No updates computed")
-    return 0
+def _merge_into_profiles(
+    profiles: Collection, source: Collection, pipeline: list[dict], mergeable: bool,
+) -> None:
+    """Run a per-driver pipeline and merge its fields into opponent_profiles.
+
+    The pipeline must emit one {driver_code, <fields>} document per driver.
+    With a unique driver_code index the results are written server-side by
+    $merge; otherwise they are fetched and applied as bulk updates.
+    """
+    if mergeable:
+        source.aggregate(pipeline + [{"$merge": {
+            "into": profiles.name,
+            "on": "driver_code",
+            "whenMatched": "merge",
+            "whenNotMatched": "discard",
+        }}], allowDiskUse=True)
+        return
+
+    ops = []
+    for doc in source.aggregate(pipeline, allowDiskUse=True):
+        code = doc.pop("driver_code", None)
+        if code and doc:
+            ops.append(UpdateOne({"driver_code": code}, {"$set": doc}))
+    if ops:
+        parallel_bulk_write(profiles, ops)
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -486,15 +963,24 @@ def fix_circuit_profiles(db: Database) -> int:
     print("\n[5/7] Fixing opponent_circuit_profiles null fields...")
 
     # --- avg_finish_position + avg_positions_gained ---
-    # Use fastf1_laps: get grid position (lap 1) and final position (max lap)
+    # Use fastf1_laps: get grid position (lap 1) and final position (max lap).
+    # The same scan also sums clean lap times (> 60s) per race for the heat
+    # delta below, so fastf1_laps is only read once for both.
+    clean_lap = {"$and": [{"$isNumber": "$LapTime"}, {"$gt": ["$LapTime", 60]}]}
     finish_pipeline = [
         {"$match": {"SessionType": "R"}},
+        {"$project": {
+            "_id": 0, "Driver": 1, "Year": 1, "Race": 1,
+            "LapNumber": 1, "Position": 1, "LapTime": 1,
+        }},
         {"$sort": {"LapNumber": -1}},
         {"$group": {
             "_id": {"Driver": "$Driver", "Year": "$Year", "Race": "$Race"},
             "final_position": {"$first": "$Position"},
             "grid_position": {"$last": "$Position"},
             "max_lap": {"$first": "$LapNumber"},
+            "lap_time_sum": {"$sum": {"$cond": [clean_lap, {"$toDouble": "$LapTime"}, 0]}},
+            "lap_time_n": {"$sum": {"$cond": [clean_lap, 1, 0]}},
         }},
     ]
     finish_results = list(db["fastf1_laps"].aggregate(finish_pipeline, allowDiskUse=True))
@@ -520,58 +1006,49 @@ def fix_circuit_profiles(db: Database) -> int:
     ):
         hot_races.add(doc["Race"])
 
-    # Get per-driver per-circuit median lap times for hot vs all races
-    heat_pipeline = [
-        {"$match": {"SessionType": "R", "LapTime": {"$gt": 60}}},
-        {"$group": {
-            "_id": {"Driver": "$Driver", "Race": "$Race"},
-            "avg_laptime": {"$avg": {"$toDouble": "$LapTime"}},
-        }},
-    ]
-    heat_results = list(db["fastf1_laps"].aggregate(heat_pipeline, allowDiskUse=True))
-
-    driver_all_times: dict[str, list] = defaultdict(list)
-    driver_hot_times: dict[str, list] = defaultdict(list)
-    circuit_heat: dict[tuple, float] = {}
-
-    for r in heat_results:
-        drv = r["_id"]["Driver"]
-        race = r["_id"]["Race"]
-        driver_all_times[drv].append(r["avg_laptime"])
-        if race in hot_races:
-            driver_hot_times[drv].append(r["avg_laptime"])
-
-    for drv in driver_all_times:
-        if drv in driver_hot_times and driver_all_times[drv]:
-            all_avg = np.mean(driver_all_times[drv])
-            hot_avg = np.mean(driver_hot_times[drv])
-            for race in hot_races:
-                circuit_heat[(drv, race)] = round(float(hot_avg - all_avg), 4)
+    # Per-driver per-circuit average lap time, pooled over every year from
+    # the lap-time sums collected by the finish scan
+    heat = pd.DataFrame(
+        [
+            (r["_id"]["Driver"], r["_id"]["Race"], r["lap_time_sum"], r["lap_time_n"])
+            for r in finish_results
+        ],
+        columns=["Driver", "Race", "lap_time_sum", "lap_time_n"],
+    ).groupby(["Driver", "Race"], as_index=False, dropna=False)[["lap_time_sum", "lap_time_n"]].sum()
+    heat = heat[heat["lap_time_n"] > 0]
+    heat["avg_laptime"] = heat["lap_time_sum"] / heat["lap_time_n"]
+
+    # Circuit-specific delta: each hot race's average lap time vs the
+    # driver's baseline (mean of their per-race averages across all races)
+    heat["delta"] = heat["avg_laptime"] - heat.groupby("Driver")["avg_laptime"].transform("mean")
+    hot = heat[heat["Race"].isin(hot_races)]
+    circuit_heat: dict[tuple, float] = dict(zip(zip(hot["Driver"], hot["Race"]), hot["delta"].round(4)))
 
     # --- stint_endurance_slope ---
-    # Degradation slope per stint: from fastf1_laps
-    stint_pipeline = [
-        {"$match": {"SessionType": "R", "LapTime": {"$gt": 60}, "TyreLife": {"$ne": None}}},
-        {"$group": {
-            "_id": {"Driver": "$Driver", "Race": "$Race", "Stint": "$Stint"},
-            "lap_numbers": {"$push": "$LapNumber"},
-            "lap_times": {"$push": {"$toDouble": "$LapTime"}},
-            "count": {"$sum": 1},
-        }},
-        {"$match": {"count": {"$gte": 5}}},
-    ]
-    stint_results = list(db["fastf1_laps"].aggregate(stint_pipeline, allowDiskUse=True))
-
-    circuit_slopes: dict[tuple, list] = defaultdict(list)
-    for r in stint_results:
-        drv = r["_id"]["Driver"]
-        race = r["_id"]["Race"]
-        laps = np.array(r["lap_numbers"], dtype=float)
-        times = np.array(r["lap_times"], dtype=float)
-        mask = ~np.isnan(laps) & ~np.isnan(times)
-        if mask.sum() >= 4:
-            slope = np.polyfit(laps[mask], times[mask], 1)[0]
-            circuit_slopes[(drv, race)].append(slope)
+    # Degradation slope per stint: projected find of the lap rows, then one
+    # vectorised least-squares pass over every (driver, race, stint) group
+    stint_laps = pd.DataFrame(list(db["fastf1_laps"].find(
+        {"SessionType": "R", "LapTime": {"$gt": 60}, "TyreLife": {"$ne": None}},
+        {"Driver": 1, "Race": 1, "Stint": 1, "LapNumber": 1, "LapTime": 1, "_id": 0},
+        batch_size=10_000,
+    )), columns=["Driver", "Race", "Stint", "LapNumber", "LapTime"])
+
+    circuit_slopes: dict[tuple, float] = {}
+    if not stint_laps.empty:
+        stint_keys = ["Driver", "Race", "Stint"]
+        stint_laps["LapNumber"] = pd.to_numeric(stint_laps["LapNumber"], errors="coerce")
+        stint_laps["LapTime"] = pd.to_numeric(stint_laps["LapTime"], errors="coerce")
+        stint_laps["stint_size"] = stint_laps.groupby(stint_keys, dropna=False)["Driver"].transform("size")
+        stint_laps = stint_laps[stint_laps["stint_size"] >= 5].dropna(subset=["LapNumber", "LapTime"])
+
+        grp = stint_laps.groupby(stint_keys, dropna=False)
+        x = stint_laps["LapNumber"] - grp["LapNumber"].transform("mean")
+        sums = stint_laps.assign(sxy=x * stint_laps["LapTime"], sxx=x * x, n=1).groupby(
+            stint_keys, dropna=False,
+        )[["sxy", "sxx", "n"]].sum()
+        sums = sums[sums["n"] >= 4]
+        slopes = (sums["sxy"] / sums["sxx"]).groupby(level=["Driver", "Race"]).mean()
+        circuit_slopes = slopes.to_dict()
 
     # --- Build updates ---
     ops = []
@@ -588,17 +1065,16 @@ def fix_circuit_profiles(db: Database) -> int:
             update["avg_positions_gained"] = round(float(np.mean(circuit_gained[key])), 2)
 
         if key in circuit_heat:
-            update["lap_time_delta_high_heat"] = circuit_heat[key]
+            update["lap_time_delta_high_heat"] = float(circuit_heat[key])
 
         if key in circuit_slopes:
-            update["stint_endurance_slope"] = round(float(np.mean(circuit_slopes[key])), 5)
+            update["stint_endurance_slope"] = round(float(circuit_slopes[key]), 5)
 
         if update:
             ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
 
     if ops:
-        result = db["opponent_circuit_profiles"].bulk_write(ops, ordered=False)
-        count = result.modified_count
+        count = parallel_bulk_write(db["opponent_circuit_profiles"], ops)
         print(f"  ✅ Updated {count} circuit profiles")
         return count
 
@@ -620,22 +1096,13 @@ def fix_race_control_driver_numbers(db: Database) -> int:
         {"$set": {"driver_number": None}},
     )
 
-    # Fix numeric strings → int
-    # Find docs where driver_number is a string that looks like a number
-    numeric_fixed = 0
-    for doc in db["openf1_race_control"].find(
-        {"driver_number": {"$type": "string"}},
-        {"driver_number": 1},
-    ):
-        try:
-            num = int(doc["driver_number"])
-            db["openf1_race_control"].update_one(
-                {"_id": doc["_id"]},
-                {"$set": {"driver_number": num}},
-            )
-            numeric_fixed += 1
-        except (ValueError, TypeError):
-            pass
+    # Fix numeric strings → int in a single server-side pipeline update
+    # instead of one update_one round trip per document
+    r2 = db["openf1_race_control"].update_many(
+        {"driver_number": {"$type": "string", "$regex": r"^\s*-?\d+\s*$"}},
+        [{"$set": {"driver_number": {"$toInt": {"$trim": {"input": "$driver_number"}}}}}],
+    )
+    numeric_fixed = r2.modified_count
 
     total = r1.modified_count + numeric_fixed
     print(f"  ✅ Fixed {r1.modified_count} None/nan → null, {numeric_fixed} string → int")
@@ -647,23 +1114,27 @@ def fix_race_control_driver_numbers(db: Database) -> int:
 # ══════════════════════════════════════════════════════════════════════════════
 
 def clean_dead_fields(db: Database) -> dict[str, int]:
-    """Remove universally-null fields that add no value."""
+    """Remove universally-null fields that add no value.
+
+    Only documents that still carry a dead field are matched, so re-runs
+    after the first sweep are a no-op instead of a full collection rewrite.
+    """
     print("\n[7/7] Cleaning dead fields...")
     results = {}
 
     # fastf1_laps: Deleted, LapStartDate, Position are 100% null
     dead_laps_fields = ["Deleted", "DeletedReason", "LapStartDate"]
     r = db["fastf1_laps"].update_many(
-        {},
-        {"$unset": {f: "" for f in dead_laps_fields}},
+        {"$or": [{f: {"$exists": True}} for f in dead_laps_fields]},
+        [{"$unset": dead_laps_fields}],
     )
     results["fastf1_laps"] = r.modified_count
     print(f"  ✅ fastf1_laps: unset {dead_laps_fields} from {r.modified_count} docs")
 
     # openf1_pit: stop_duration is 100% null
     r = db["openf1_pit"].update_many(
-        {},
-        {"$unset": {"stop_duration": ""}},
+        {"stop_duration": {"$exists": True}},
+        [{"$unset": ["stop_duration"]}],
     )
     results["openf1_pit"] = r.modified_count
     print(f"  ✅ openf1_pit: unset stop_duration from {r.modified_count} docs")
@@ -675,35 +1146,54 @@ def clean_dead_fields(db: Database) -> dict[str, int]:
 # MAIN
 # ══════════════════════════════════════════════════════════════════════════════
 
-def main():
+# Stages grouped into waves. Stages within a wave touch disjoint data and run
+# concurrently; waves run in order. Wave 2 reads fastf1_laps (so it waits
+# for dedup) and writes opponent_* profiles after the braking G fix.
+STAGE_WAVES = [
+    [
+        ("braking_g_fixed", fix_braking_g),                        # opponent_profiles (braking fields)
+        ("dedup", deduplicate_fastf1),                             # fastf1_laps, fastf1_weather
+        ("indexes_created", add_openf1_indexes),                   # openf1_* indexes
+        ("race_control_fixed", fix_race_control_driver_numbers),   # openf1_race_control
+    ],
+    [
+        ("profiles_updated", compute_missing_profile_fields),      # opponent_profiles
+        ("circuit_profiles_fixed", fix_circuit_profiles),          # opponent_circuit_profiles
+        ("dead_fields_cleaned", clean_dead_fields),                # fastf1_laps, openf1_pit
+    ],
+]
+
+
+def _run_stage(fn):
+    """Run one fix stage in a worker process with its own MongoDB client."""
+    return fn(get_db())
+
+
+def main(parallel: bool = True):
     db = get_db()
     print("✅ Connected to MongoDB")
     print(f"\n{'=' * 60}")
     print("  DATA QUALITY FIXES")
     print(f"{'=' * 60}")
 
-    summary = {}
-
-    # 1. Fix braking G
-    summary["braking_g_fixed"] = fix_braking_g(db)
-
-    # 2. Deduplicate
-    summary["dedup"] = deduplicate_fastf1(db)
-
-    # 3. Add indexes
-    summary["indexes_created"] = add_openf1_indexes(db)
+    # Stage workers read telemetry_compressed concurrently; index it once up front
+    ensure_telemetry_index(db)
 
-    # 4. Compute missing profile fields
-    summary["profiles_updated"] = compute_missing_profile_fields(db)
-
-    # 5. Fix circuit profiles
-    summary["circuit_profiles_fixed"] = fix_circuit_profiles(db)
-
-    # 6. Fix race control driver numbers
-    summary["race_control_fixed"] = fix_race_control_driver_numbers(db)
+    summary = {}
 
-    # 7. Clean dead fields
-    summary["dead_fields_cleaned"] = clean_dead_fields(db)
+    if parallel:
+        # Spawn (not fork) so workers never inherit the parent's MongoClient
+        ctx = multiprocessing.get_context("spawn")
+        workers = max(len(wave) for wave in STAGE_WAVES)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as executor:
+            for wave in STAGE_WAVES:
+                futures = {key: executor.submit(_run_stage, fn) for key, fn in wave}
+                for key, fut in futures.items():
+                    summary[key] = fut.result()
+    else:
+        for wave in STAGE_WAVES:
+            for key, fn in wave:
+                summary[key] = fn(db)
 
     # Final summary
     print(f"\n{'=' * 60}")
@@ -750,4 +1240,31 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Data quality fixes")
+    parser.add_argument(
+        "--build-telemetry-cache", action="store_true",
+        help=f"Write telemetry_compressed to Parquet under {TELEMETRY_CACHE_DIR} and exit",
+    )
+    parser.add_argument(
+        "--migrate-telemetry-zstd", action="store_true",
+        help=f"Re-encode new or changed telemetry_compressed files into {TELEMETRY_ZSTD_COLLECTION} and exit",
+    )
+    parser.add_argument(
+        "--create-profile-merge-index", action="store_true",
+        help="Add a unique driver_code index to opponent_profiles and exit",
+    )
+    parser.add_argument("--serial", action="store_true", help="Run the fix stages one at a time")
+    args = parser.parse_args()
+    if args.build_telemetry_cache:
+        n = build_telemetry_parquet_cache(get_db())
+        print(f"\n✅ Cached {n} telemetry files")
+    elif args.migrate_telemetry_zstd:
+        n = migrate_telemetry_to_zstd(get_db())
+        print(f"\n✅ Re-encoded {n} telemetry chunks")
+    elif args.create_profile_merge_index:
+        if create_profile_merge_index(get_db()):
+            print("\n✅ opponent_profiles.driver_code unique index ready")
+        else:
+            print("\n⚠ opponent_profiles has duplicate driver_codes or a non-unique driver_code index")
+    else:
+        main(parallel=not args.serial)
@@ -18,55 +18,123 @@ from pymongo import UpdateOne
 
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 from updater._db import get_db
-from data_quality_fixes import load_telemetry_from_mongo
+from data_quality_fixes import load_driver_number_map, load_telemetry_from_mongo
+
+try:
+    import pyarrow  # noqa: F401 — enables the "string[pyarrow]" dtype
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+try:
+    import pyarrow as pa
+    from pymongoarrow.api import Schema, find_arrow_all
+    PYMONGOARROW_AVAILABLE = True
+except ImportError:
+    PYMONGOARROW_AVAILABLE = False
+
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import polars as pl
+    POLARS_AVAILABLE = True
+except ImportError:
+    POLARS_AVAILABLE = False
 
 warnings.filterwarnings("ignore")
 
 OUT_COL = "driver_performance_markers"
 
+# Arrow-backed strings for the groupby keys: contiguous buffers instead of
+# boxed Python objects, cheaper to hash
+KEY_DTYPE = "string[pyarrow]" if PYARROW_AVAILABLE else object
+
+# Field order of the output documents (after "Driver")
+MARKER_COLUMNS = [
+    "years_covered", "total_race_laps",
+    # Pace degradation
+    "degradation_slope_s_per_lap", "late_race_delta_s", "lap_time_consistency_std",
+    # Sector consistency
+    "sector1_cv", "sector2_cv", "sector3_cv",
+    # Weather sensitivity
+    "heat_lap_delta_s", "humidity_lap_delta_s",
+    # Telemetry markers
+    "throttle_smoothness", "brake_overlap_rate", "avg_top_speed_kmh",
+    "avg_throttle_pct", "late_race_speed_drop_kmh",
+    # Tyre stint endurance
+    "long_stint_lap_delta", "avg_stint_length",
+]
+
+# Decimal places of the groupby markers (the rest are stored unrounded)
+MARKER_DECIMALS = {
+    "lap_time_consistency_std": 4,
+    "degradation_slope_s_per_lap": 5,
+    "late_race_delta_s": 4,
+    "heat_lap_delta_s": 4,
+    "humidity_lap_delta_s": 4,
+    "sector1_cv": 4, "sector2_cv": 4, "sector3_cv": 4,
+    "avg_top_speed_kmh": 2,
+    "avg_throttle_pct": 2,
+}
+
+# Below this many drivers a single bulk_write beats staging + $merge
+MERGE_MIN_DOCS = 200
+
+LAP_KEY_COLS = ["Driver", "Race"]
+LAP_NUMERIC_COLS = [
+    "Year", "LapNumber", "LapTime", "TyreLife", "Stint",
+    "Sector1Time", "Sector2Time", "Sector3Time",
+]
+
 
 # ── Marker Computation Functions ──────────────────────────────────────────────
 
-def throttle_smoothness(series: pd.Series) -> float:
-    diffs = series.diff().abs().dropna()
-    return round(float(diffs.mean()), 4) if len(diffs) > 0 else np.nan
+def throttle_smoothness(series: pd.Series, dtype=np.float32) -> float:
+    # Mean absolute sample-to-sample change: one float32 buffer, abs in place,
+    # accumulated in float64
+    a = series.to_numpy(dtype=dtype, na_value=np.nan)
+    diffs = np.subtract(a[1:], a[:-1])
+    np.abs(diffs, out=diffs)
+    n = diffs.size - np.count_nonzero(np.isnan(diffs))
+    return round(float(np.nansum(diffs, dtype=np.float64) / n), 4) if n > 0 else np.nan
+
+
+if NUMBA_AVAILABLE:
+    # No fastmath: it would let LLVM assume the isnan() checks are always false
+    @numba.njit(parallel=True, cache=True)
+    def _overlap_and_count(throttle: np.ndarray, brake: np.ndarray) -> tuple[int, int]:
+        """(throttle > 10 while braking, non-NaN throttle samples) in one pass."""
+        overlap = 0
+        total = 0
+        for i in numba.prange(throttle.size):
+            if not np.isnan(throttle[i]):
+                total += 1
+                if throttle[i] > 10 and brake[i]:
+                    overlap += 1
+        return overlap, total
+else:
+    def _overlap_and_count(throttle: np.ndarray, brake: np.ndarray) -> tuple[int, int]:
+        return int(((throttle > 10) & brake).sum()), int(np.count_nonzero(~np.isnan(throttle)))
 
 
 def brake_overlap_rate(throttle: pd.Series, brake: pd.Series) -> float:
-    overlap = ((throttle > 10) & (brake == True)).sum()
-    total = len(throttle.dropna())
+    t = throttle.to_numpy(dtype=np.float32, na_value=np.nan)
+    # Missing brake samples count as not braking
+    b = brake.to_numpy(dtype=np.bool_) if brake.dtype == bool else (brake == True).to_numpy(dtype=np.bool_)
+    overlap, total = _overlap_and_count(t, b)
     return round(float(overlap / total), 4) if total > 0 else np.nan
 
 
-def lap_time_std(lap_times: pd.Series) -> float:
-    clean = lap_times.dropna()
-    return round(float(clean.std()), 4) if len(clean) > 1 else np.nan
-
-
-def sector_consistency(sector_series: pd.Series) -> float:
-    clean = sector_series.dropna()
-    if clean.mean() == 0 or len(clean) < 2:
-        return np.nan
-    return round(float(clean.std() / clean.mean()), 4)
-
-
-def degradation_slope(lap_numbers: pd.Series, lap_times: pd.Series) -> float:
-    df = pd.DataFrame({"lap": lap_numbers, "time": lap_times}).dropna()
-    if len(df) < 4:
-        return np.nan
-    slope = np.polyfit(df["lap"].values, df["time"].values, 1)[0]
-    return round(float(slope), 5)
-
-
-def late_race_delta(lap_times: pd.Series, lap_numbers: pd.Series) -> float:
-    df = pd.DataFrame({"lap": lap_numbers, "time": lap_times}).dropna()
-    if len(df) < 8:
-        return np.nan
-    cutoff_early = df["lap"].quantile(0.25)
-    cutoff_late = df["lap"].quantile(0.75)
-    early = df[df["lap"] <= cutoff_early]["time"].mean()
-    late = df[df["lap"] >= cutoff_late]["time"].mean()
-    return round(float(late - early), 4)
+def _sorted_quantile(values: np.ndarray, q: float) -> float:
+    """Linearly interpolated quantile (pandas' default) of an already sorted array."""
+    h = (len(values) - 1) * q
+    lo = int(h)
+    hi = min(lo + 1, len(values) - 1)
+    return float(values[lo] + (h - lo) * (values[hi] - values[lo]))
 
 
 def late_race_speed_drop(speeds: pd.Series, lap_numbers: pd.Series) -> float:
@@ -74,69 +142,189 @@ def late_race_speed_drop(speeds: pd.Series, lap_numbers: pd.Series) -> float:
     if len(df) < 8:
         return np.nan
     per_lap = df.groupby("lap")["speed"].max()
-    cutoff_early = per_lap.index.to_series().quantile(0.25)
-    cutoff_late = per_lap.index.to_series().quantile(0.75)
+    # groupby leaves the lap numbers sorted, so the quartiles are direct lookups
+    laps = per_lap.index.to_numpy(dtype=np.float64)
+    cutoff_early = _sorted_quantile(laps, 0.25)
+    cutoff_late = _sorted_quantile(laps, 0.75)
     early = per_lap[per_lap.index <= cutoff_early].mean()
     late = per_lap[per_lap.index >= cutoff_late].mean()
     return round(float(late - early), 3)
 
 
-def avg_top_speed(speeds: pd.Series) -> float:
-    return round(float(speeds.quantile(0.99)), 2) if len(speeds) > 0 else np.nan
+def weather_race_sets(weather_df: pd.DataFrame | None) -> dict[str, set]:
+    """Races run in each weather condition, keyed by the marker they feed."""
+    if weather_df is None or weather_df.empty:
+        return {}
+    return {
+        "heat_lap_delta_s": set(weather_df.loc[weather_df["TrackTemp"] > 45, "Race"].unique()),
+        "humidity_lap_delta_s": set(weather_df.loc[weather_df["Humidity"] > 70, "Race"].unique()),
+    }
 
 
-def avg_throttle_pct(throttle: pd.Series) -> float:
-    return round(float(throttle.mean()), 2) if len(throttle) > 0 else np.nan
+def vectorized_markers(
+    laps_df: pd.DataFrame,
+    race_tel: pd.DataFrame,
+    weather_races: dict[str, set],
+) -> pd.DataFrame:
+    """Lap and race-telemetry markers for every driver in one groupby pass each.
+
+    Returns a frame indexed by Driver; a marker is NaN where the driver has
+    too little data for it. Runs on Polars when installed, pandas otherwise.
+    """
+    if POLARS_AVAILABLE:
+        markers_df = _polars_markers(laps_df, race_tel, weather_races)
+    else:
+        markers_df = _pandas_markers(laps_df, race_tel, weather_races)
+    markers_df["years_covered"] = markers_df["years_covered"].map(
+        lambda years: sorted(int(y) for y in years if pd.notna(y))
+    )
+    return markers_df.round(MARKER_DECIMALS)
 
 
-def heat_lap_delta(race_laps: pd.DataFrame, weather_df: pd.DataFrame) -> float:
-    if weather_df is None or weather_df.empty:
-        return np.nan
-    hot = weather_df[weather_df["TrackTemp"] > 45]
-    if hot.empty:
-        return np.nan
-    hot_races = hot["Race"].unique()
-    hot_laps = race_laps[race_laps["Race"].isin(hot_races)]["LapTime"]
-    all_laps = race_laps["LapTime"]
-    if hot_laps.dropna().empty or all_laps.dropna().empty:
-        return np.nan
-    return round(float(hot_laps.median() - all_laps.median()), 4)
+def _polars_markers(
+    laps_df: pd.DataFrame,
+    race_tel: pd.DataFrame,
+    weather_races: dict[str, set],
+) -> pd.DataFrame:
+    """vectorized_markers as Polars expressions: one multi-threaded
+    group_by over the laps and one over the race telemetry."""
+    lap_time, lap_no = pl.col("LapTime"), pl.col("LapNumber")
+    is_race = lap_time.is_not_null() & (lap_time > 60)
+    race_time = lap_time.filter(is_race)
+    # Degradation fit over race laps with a lap number
+    fit_mask = is_race & lap_no.is_not_null()
+    fit_x, fit_y = lap_no.filter(fit_mask), lap_time.filter(fit_mask)
+    n_fit = fit_mask.sum()
+    n_race = is_race.sum()
+
+    aggs = [
+        race_time.std().alias("lap_time_consistency_std"),
+        pl.when(n_fit >= 4).then(pl.cov(fit_x, fit_y) / fit_x.var()).alias("degradation_slope_s_per_lap"),
+        pl.when(n_fit >= 8).then(
+            fit_y.filter(fit_x >= fit_x.quantile(0.75, "linear")).mean()
+            - fit_y.filter(fit_x <= fit_x.quantile(0.25, "linear")).mean()
+        ).alias("late_race_delta_s"),
+        pl.when(n_race > 0).then(n_race).alias("total_race_laps"),
+        pl.col("Year").unique().alias("years_covered"),
+    ]
+    for key, races in weather_races.items():
+        in_cond = pl.col("Race").is_in(list(races))
+        aggs.append((lap_time.filter(is_race & in_cond).median() - race_time.median()).alias(key))
+    for col in ("Sector1Time", "Sector2Time", "Sector3Time"):
+        if col in laps_df.columns:
+            mean = pl.col(col).mean()
+            aggs.append((pl.col(col).std() / pl.when(mean != 0).then(mean)).alias(
+                f"{col.removesuffix('Time').lower()}_cv"
+            ))
+    has_stints = "TyreLife" in laps_df.columns and "Stint" in laps_df.columns
+    if has_stints:
+        aggs.append(
+            (lap_time.filter(pl.col("TyreLife") > 20).mean() - race_time.mean()).alias("long_stint_lap_delta")
+        )
+
+    laps = pl.from_pandas(laps_df).lazy().filter(pl.col("Driver").is_not_null())
+    frames = [laps.group_by("Driver").agg(aggs)]
+    if has_stints:
+        stint_keys = ["Driver", "Year", "Race", "Stint"]
+        frames.append(
+            laps.drop_nulls(stint_keys)
+            .group_by(stint_keys).agg(lap_no.count().alias("stint_laps"))
+            .group_by("Driver").agg(pl.col("stint_laps").mean().alias("avg_stint_length"))
+        )
+    if not race_tel.empty:
+        frames.append(
+            pl.from_pandas(race_tel[["Driver", "Speed", "Throttle"]]).lazy()
+            .filter(pl.col("Driver").is_not_null())
+            .group_by("Driver").agg(
+                pl.col("Speed").quantile(0.99, "linear").alias("avg_top_speed_kmh"),
+                pl.col("Throttle").mean().alias("avg_throttle_pct"),
+            )
+        )
 
+    out = frames[0]
+    for frame in frames[1:]:
+        out = out.join(frame, on="Driver", how="full", coalesce=True)
+    out = out.collect().to_pandas().set_index("Driver")
+    out["years_covered"] = out["years_covered"].map(lambda ys: [] if ys is None else ys)
+    return out
 
-def humidity_lap_delta(race_laps: pd.DataFrame, weather_df: pd.DataFrame) -> float:
-    if weather_df is None or weather_df.empty:
-        return np.nan
-    humid = weather_df[weather_df["Humidity"] > 70]
-    if humid.empty:
-        return np.nan
-    humid_races = humid["Race"].unique()
-    humid_laps = race_laps[race_laps["Race"].isin(humid_races)]["LapTime"]
-    all_laps = race_laps["LapTime"]
-    if humid_laps.dropna().empty or all_laps.dropna().empty:
-        return np.nan
-    return round(float(humid_laps.median() - all_laps.median()), 4)
 
+def _pandas_markers(
+    laps_df: pd.DataFrame,
+    race_tel: pd.DataFrame,
+    weather_races: dict[str, set],
+) -> pd.DataFrame:
+    """vectorized_markers with pandas groupbys."""
+    race_laps = laps_df[laps_df["LapTime"].notna() & (laps_df["LapTime"] > 60)]
+    g = race_laps.groupby("Driver", sort=False)
+    markers = {"lap_time_consistency_std": g["LapTime"].std()}
+
+    # Pace degradation: closed-form OLS slope sum(dx*y) / sum(dx*dx) with dx
+    # centred on each driver's mean lap (no polyfit, and no cancellation from
+    # raw sums of squares), and the late-vs-early delta around each driver's
+    # 25th/75th lap-number quantiles
+    fit = race_laps.dropna(subset=["LapNumber"])
+    x, y = fit["LapNumber"], fit["LapTime"]
+    dx = x - x.groupby(fit["Driver"], sort=False).transform("mean")
+    sums = pd.DataFrame({"sxy": dx * y, "sxx": dx * dx, "n": 1}).groupby(fit["Driver"], sort=False).sum()
+    slope = sums["sxy"] / sums["sxx"]
+    markers["degradation_slope_s_per_lap"] = slope.where(sums["n"] >= 4)
+
+    q = fit.groupby("Driver", sort=False)["LapNumber"].quantile([0.25, 0.75]).unstack()
+    early = y.where(x <= fit["Driver"].map(q[0.25])).groupby(fit["Driver"], sort=False).mean()
+    late = y.where(x >= fit["Driver"].map(q[0.75])).groupby(fit["Driver"], sort=False).mean()
+    markers["late_race_delta_s"] = (late - early).where(sums["n"] >= 8)
+
+    # Weather sensitivity: median lap time in the condition's races vs overall
+    all_median = g["LapTime"].median()
+    for key, races in weather_races.items():
+        in_cond = race_laps[race_laps["Race"].isin(races)]
+        cond_median = in_cond.groupby("Driver", sort=False)["LapTime"].median()
+        markers[key] = cond_median - all_median
+
+    # Sector consistency (coefficient of variation) over all of a driver's laps
+    sector_cols = [c for c in ("Sector1Time", "Sector2Time", "Sector3Time") if c in laps_df.columns]
+    if sector_cols:
+        # std is already NaN for a single lap, so only a zero mean needs masking
+        stats = laps_df.groupby("Driver", sort=False)[sector_cols].agg(["mean", "std"])
+        cv = stats.xs("std", axis=1, level=1) / stats.xs("mean", axis=1, level=1).replace(0, np.nan)
+        cv.columns = [f"{col.removesuffix('Time').lower()}_cv" for col in cv.columns]
+        markers.update(cv.items())
+
+    # Telemetry speed / throttle levels
+    if not race_tel.empty:
+        tg = race_tel.groupby("Driver", sort=False)
+        markers["avg_top_speed_kmh"] = tg["Speed"].quantile(0.99)
+        markers["avg_throttle_pct"] = tg["Throttle"].mean()
 
-# ── Helpers ───────────────────────────────────────────────────────────────────
+    # Tyre stint endurance
+    if "TyreLife" in laps_df.columns and "Stint" in laps_df.columns:
+        long_stints = laps_df[laps_df["TyreLife"] > 20].groupby("Driver", sort=False)["LapTime"].mean()
+        markers["long_stint_lap_delta"] = long_stints - g["LapTime"].mean()
+        stint_lengths = laps_df.groupby(["Driver", "Year", "Race", "Stint"], sort=False)["LapNumber"].count()
+        markers["avg_stint_length"] = stint_lengths.groupby(level="Driver", sort=False).mean()
+
+    markers["total_race_laps"] = g.size()
+    markers["years_covered"] = laps_df.groupby("Driver", sort=False)["Year"].unique()
+
+    out = pd.DataFrame(markers)
+    # Drivers with race telemetry but no laps align to NaN here
+    out["years_covered"] = out["years_covered"].map(
+        lambda ys: ys if isinstance(ys, (list, np.ndarray)) else []
+    )
+    return out
 
-def safe(val):
-    """Convert numpy types and NaN to Python-safe values for MongoDB."""
-    if val is None or (isinstance(val, float) and np.isnan(val)):
-        return None
-    if isinstance(val, (np.integer,)):
-        return int(val)
-    if isinstance(val, (np.floating,)):
-        return float(val)
-    return val
 
+def telemetry_markers(drv_tel: pd.DataFrame) -> dict[str, float]:
+    """Telemetry markers that need the driver's samples in time order."""
+    return {
+        "throttle_smoothness": throttle_smoothness(drv_tel["Throttle"]),
+        "brake_overlap_rate": brake_overlap_rate(drv_tel["Throttle"], drv_tel["Brake"]),
+        "late_race_speed_drop_kmh": late_race_speed_drop(drv_tel["Speed"], drv_tel["LapNumber"]),
+    }
 
-def build_driver_number_map(db) -> dict[str, str]:
-    """Map driver number (str) → three-letter code using openf1_drivers."""
-    mapping = {}
-    for doc in db["openf1_drivers"].find({}, {"driver_number": 1, "name_acronym": 1, "_id": 0}):
-        mapping[str(doc["driver_number"])] = doc["name_acronym"]
-    return mapping
 
+# ── Helpers ───────────────────────────────────────────────────────────────────
 
 def load_all_telemetry(db, driver_number_map: dict[str, str]) -> pd.DataFrame:
     """Load race telemetry from telemetry_compressed, remap driver numbers → codes."""
@@ -148,94 +336,81 @@ def load_all_telemetry(db, driver_number_map: dict[str, str]) -> pd.DataFrame:
         print("  ⚠ No telemetry found in telemetry_compressed")
         return pd.DataFrame()
 
-    tel_df["Driver"] = tel_df["Driver"].astype(str).map(driver_number_map)
+    # Remap via the (few) distinct driver numbers and an integer take, rather
+    # than stringifying and hashing every telemetry row
+    numbers = pd.Categorical(tel_df["Driver"])
+    codes = np.asarray(numbers.categories.astype(str).map(driver_number_map), dtype=object)
+    drivers = codes[numbers.codes] if len(codes) else np.full(len(tel_df), None, dtype=object)
+    drivers[numbers.codes < 0] = None
+    tel_df["Driver"] = drivers
     tel_df = tel_df.dropna(subset=["Driver"])
+    tel_df = tel_df.astype({"Driver": KEY_DTYPE, "Session": KEY_DTYPE})
     print(f"  Loaded {len(tel_df):,} telemetry rows from telemetry_compressed")
     return tel_df
 
 
-def process_driver(
-    driver_code: str,
-    laps_df: pd.DataFrame,
-    weather_df: pd.DataFrame,
-    tel_df: pd.DataFrame,
-) -> dict | None:
-    """Compute all markers for one driver."""
-
-    drv_laps = laps_df[laps_df["Driver"] == driver_code].copy()
-    if drv_laps.empty:
-        print(f"    ⚠ No lap data for {driver_code}")
-        return None
-
-    race_laps = drv_laps[drv_laps["LapTime"].notna() & (drv_laps["LapTime"] > 60)]
-    if race_laps.empty:
-        print(f"    ⚠ No valid race laps for {driver_code}")
-        return None
-
-    print(f"  {driver_code}: {len(race_laps)} race laps", end="")
-
-    markers = {
-        "Driver": driver_code,
-        "years_covered": sorted(int(y) for y in drv_laps["Year"].dropna().unique()),
-        "total_race_laps": int(len(race_laps)),
-
-        # Pace degradation
-        "degradation_slope_s_per_lap": safe(degradation_slope(
-            race_laps["LapNumber"], race_laps["LapTime"]
-        )),
-        "late_race_delta_s": safe(late_race_delta(
-            race_laps["LapTime"], race_laps["LapNumber"]
-        )),
-        "lap_time_consistency_std": safe(lap_time_std(race_laps["LapTime"])),
-
-        # Sector consistency
-        "sector1_cv": safe(sector_consistency(drv_laps.get("Sector1Time", pd.Series(dtype=float)))),
-        "sector2_cv": safe(sector_consistency(drv_laps.get("Sector2Time", pd.Series(dtype=float)))),
-        "sector3_cv": safe(sector_consistency(drv_laps.get("Sector3Time", pd.Series(dtype=float)))),
-
-        # Weather sensitivity
-        "heat_lap_delta_s": safe(heat_lap_delta(race_laps, weather_df)),
-        "humidity_lap_delta_s": safe(humidity_lap_delta(race_laps, weather_df)),
-
-        # Telemetry markers (filled below if available)
-        "throttle_smoothness": None,
-        "brake_overlap_rate": None,
-        "avg_top_speed_kmh": None,
-        "avg_throttle_pct": None,
-        "late_race_speed_drop_kmh": None,
-    }
+def load_race_laps(db) -> pd.DataFrame:
+    """Race-session fastf1_laps as a DataFrame, one column per field.
+
+    With pymongoarrow the cursor is decoded straight into Arrow columns
+    (values of the wrong BSON type become null, like to_numeric's coerce);
+    otherwise documents are decoded to dicts and unpacked by pandas.
+    """
+    query = {"SessionType": "R"}
+    if PYMONGOARROW_AVAILABLE:
+        schema = Schema({
+            **{c: pa.string() for c in LAP_KEY_COLS},
+            **{c: pa.float64() for c in LAP_NUMERIC_COLS},
+        })
+        table = find_arrow_all(db["fastf1_laps"], query, schema=schema, allow_invalid=True)
+        laps_df = table.to_pandas()
+    else:
+        laps_df = pd.DataFrame.from_records(db["fastf1_laps"].find(
+            query,
+            {c: 1 for c in LAP_KEY_COLS + LAP_NUMERIC_COLS} | {"_id": 0},
+            batch_size=10_000,
+        ))
+        for col in LAP_NUMERIC_COLS:
+            if col in laps_df.columns:
+                laps_df[col] = pd.to_numeric(laps_df[col], errors="coerce")
 
-    # Telemetry markers
-    if not tel_df.empty:
-        drv_tel = tel_df[(tel_df["Driver"] == driver_code) & (tel_df["Session"] == "R")]
-        if not drv_tel.empty:
-            print(f", {len(drv_tel):,} tel rows", end="")
-            markers["throttle_smoothness"] = safe(throttle_smoothness(drv_tel["Throttle"]))
-            markers["brake_overlap_rate"] = safe(brake_overlap_rate(drv_tel["Throttle"], drv_tel["Brake"]))
-            markers["avg_top_speed_kmh"] = safe(avg_top_speed(drv_tel["Speed"]))
-            markers["avg_throttle_pct"] = safe(avg_throttle_pct(drv_tel["Throttle"]))
-            markers["late_race_speed_drop_kmh"] = safe(late_race_speed_drop(
-                drv_tel["Speed"], drv_tel["LapNumber"]
-            ))
+    return laps_df.astype({c: KEY_DTYPE for c in LAP_KEY_COLS if c in laps_df.columns})
 
-    # Tyre stint endurance
-    if "TyreLife" in drv_laps.columns and "Stint" in drv_laps.columns:
-        long_stints = drv_laps[drv_laps["TyreLife"] > 20]
-        if not long_stints.empty:
-            markers["long_stint_lap_delta"] = safe(
-                float(long_stints["LapTime"].mean() - race_laps["LapTime"].mean())
-            )
-        else:
-            markers["long_stint_lap_delta"] = None
 
-        stint_lengths = drv_laps.groupby(["Year", "Race", "Stint"])["LapNumber"].count()
-        markers["avg_stint_length"] = safe(float(stint_lengths.mean())) if len(stint_lengths) > 0 else None
-    else:
-        markers["long_stint_lap_delta"] = None
-        markers["avg_stint_length"] = None
+def upsert_markers(db, results: list[dict]) -> None:
+    """Upsert marker docs into OUT_COL by Driver, merging into existing docs.
 
-    print()
-    return markers
+    Large result sets are staged in a scratch collection and folded in by a
+    single server-side $merge against the unique Driver index; a handful of
+    drivers go straight through one bulk_write.
+    """
+    db[OUT_COL].create_index("Driver", unique=True)
+
+    if len(results) < MERGE_MIN_DOCS:
+        ops = [
+            UpdateOne({"Driver": r["Driver"]}, {"$set": r}, upsert=True)
+            for r in results
+        ]
+        result = db[OUT_COL].bulk_write(ops, ordered=False)
+        print(f"✅ Upserted {result.upserted_count + result.modified_count} documents into {OUT_COL}")
+        return
+
+    staging = db[f"{OUT_COL}_staging"]
+    staging.drop()
+    try:
+        staging.insert_many([dict(r) for r in results], ordered=False)
+        staging.aggregate([
+            {"$unset": "_id"},
+            {"$merge": {
+                "into": OUT_COL,
+                "on": "Driver",
+                "whenMatched": "merge",
+                "whenNotMatched": "insert",
+            }},
+        ])
+    finally:
+        staging.drop()
+    print(f"✅ Merged {len(results)} documents into {OUT_COL}")
 
 
 # ── Main ──────────────────────────────────────────────────────────────────────
@@ -254,18 +429,7 @@ def main():
 
     # Load all fastf1_laps for race sessions (once, not per-driver)
     print("\nLoading fastf1_laps (race sessions)...")
-    laps_raw = list(db["fastf1_laps"].find(
-        {"SessionType": "R"},
-        {
-            "Driver": 1, "LapTime": 1, "LapNumber": 1, "Race": 1, "Year": 1,
-            "Compound": 1, "TyreLife": 1, "Stint": 1,
-            "Sector1Time": 1, "Sector2Time": 1, "Sector3Time": 1, "_id": 0,
-        },
-    ))
-    laps_df = pd.DataFrame(laps_raw)
-    for col in ["LapTime", "Sector1Time", "Sector2Time", "Sector3Time", "LapNumber", "TyreLife"]:
-        if col in laps_df.columns:
-            laps_df[col] = pd.to_numeric(laps_df[col], errors="coerce")
+    laps_df = load_race_laps(db)
     print(f"  {len(laps_df):,} lap records loaded")
 
     # Load weather (once)
@@ -279,7 +443,7 @@ def main():
 
     # Load telemetry from MongoDB (telemetry_compressed)
     print("Loading telemetry from MongoDB...")
-    driver_number_map = build_driver_number_map(db)
+    driver_number_map = load_driver_number_map(db)
     tel_df = load_all_telemetry(db, driver_number_map)
 
     # Process each driver
@@ -287,16 +451,53 @@ def main():
     print("COMPUTING PERFORMANCE MARKERS")
     print(f"{'=' * 60}")
 
-    results = []
-    skipped = []
+    # Split race telemetry by driver once; each driver is then a dict
+    # lookup instead of a boolean-mask scan over the full frame
+    race_tel = tel_df[tel_df["Session"] == "R"] if not tel_df.empty else tel_df
+    tel_by_drv = dict(iter(race_tel.groupby("Driver", sort=False))) if not race_tel.empty else {}
+
+    vec_markers = vectorized_markers(laps_df, race_tel, weather_race_sets(weather_df))
+
+    lap_drivers = set(laps_df["Driver"].dropna().unique())
+    ready = []
     for driver in drivers:
+        if driver not in lap_drivers:
+            print(f"    ⚠ No lap data for {driver}")
+        elif driver not in vec_markers.index or pd.isna(vec_markers.at[driver, "total_race_laps"]):
+            print(f"    ⚠ No valid race laps for {driver}")
+        else:
+            ready.append(driver)
+
+    # The order-dependent telemetry markers, per driver
+    tel_markers = {}
+    skipped = []
+    for driver in ready:
+        if driver not in tel_by_drv:
+            continue
         try:
-            marker = process_driver(driver, laps_df, weather_df, tel_df)
-            if marker:
-                results.append(marker)
+            tel_markers[driver] = telemetry_markers(tel_by_drv[driver])
         except Exception as e:
             print(f"  ❌ {driver}: {e}")
             skipped.append(driver)
+    ready = [d for d in ready if d not in skipped]
+
+    markers_df = vec_markers.loc[ready].join(
+        pd.DataFrame.from_dict(tel_markers, orient="index"),
+    ).reindex(columns=MARKER_COLUMNS)
+    markers_df["total_race_laps"] = markers_df["total_race_laps"].astype(int)
+
+    for driver, n_laps in markers_df["total_race_laps"].items():
+        tel_rows = f", {len(tel_by_drv[driver]):,} tel rows" if driver in tel_by_drv else ""
+        print(f"  {driver}: {n_laps} race laps{tel_rows}")
+
+    # NaN → None and NumPy scalars → Python in one pass over the frame
+    results = (
+        markers_df.astype(object)
+        .where(markers_df.notna(), None)
+        .rename_axis("Driver")
+        .reset_index()
+        .to_dict(orient="records")
+    )
 
     print(f"\n✅ Computed markers for {len(results)} drivers, skipped {len(skipped)}")
     if skipped:
@@ -304,13 +505,7 @@ def main():
 
     # Upsert to MongoDB
     if results:
-        db[OUT_COL].create_index("Driver", unique=True)
-        ops = [
-            UpdateOne({"Driver": r["Driver"]}, {"$set": r}, upsert=True)
-            for r in results
-        ]
-        result = db[OUT_COL].bulk_write(ops, ordered=False)
-        print(f"✅ Upserted {result.upserted_count + result.modified_count} documents into {OUT_COL}")
+        upsert_markers(db, results)
     else:
         print("⚠ No results to write")
 
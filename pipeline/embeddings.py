@@ -14,7 +14,7 @@ Usage:
     # Text embeddings (nomic)
     vecs = engine.embed_texts(["pipe routing algorithm", "ASME B31.1"])
 
-    # Image embeddings (CLIP)
+    # Image embeddings (CLIP) — (n, 512) float16 array
     vecs = engine.embed_images([Path("page1.png"), Path("diagram.png")])
 
     # Cross-modal: text query against image index
@@ -23,9 +23,55 @@ Usage:
 
 from __future__ import annotations
 
+import hashlib
 import json
+import os
+import sqlite3
+import threading
 from pathlib import Path
 
+import numpy as np
+
+
+# ── On-disk embedding cache ─────────────────────────────────────────────
+
+class _EmbeddingCache:
+    """Content-addressed float16 vectors in SQLite.
+
+    Keys are 16-byte blake2b digests of the model variant plus the exact
+    (prefixed) input text, so a hit never needs the model at all.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors (key BLOB PRIMARY KEY, vec BLOB NOT NULL) WITHOUT ROWID"
+        )
+
+    @staticmethod
+    def key(namespace: str, text: str) -> bytes:
+        return hashlib.blake2b(f"{namespace}\0{text}".encode(), digest_size=16).digest()
+
+    def get_many(self, keys: list[bytes]) -> dict[bytes, np.ndarray]:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM vectors WHERE key IN ({','.join('?' * len(chunk))})", chunk,
+                )
+                for key, vec in rows:
+                    found[key] = np.frombuffer(vec, dtype=np.float16).astype(np.float32)
+        return found
+
+    def put_many(self, items) -> None:
+        rows = [(key, np.asarray(vec, dtype=np.float16).tobytes()) for key, vec in items]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO vectors VALUES (?, ?)", rows)
+
 
 # ── Nomic text embeddings (via sentence-transformers / HuggingFace) ────
 
@@ -37,32 +83,98 @@ class NomicEmbedder:
     """
 
     MODEL_NAME = "nomic-ai/nomic-embed-text-v1.5"
-
-    def __init__(self):
+    # Dynamically quantised INT8 export published in the model repo
+    ONNX_INT8_FILE = "onnx/model_quantized.onnx"
+    CACHE_PATH = Path("~/.cache/f1-omnisense/nomic_embeddings.sqlite").expanduser()
+    # Token cap per input. Pipeline chunks (~1000 chars) fit well inside it;
+    # it stops one oversized text from padding a whole batch towards 8192
+    MAX_SEQ_LENGTH = 512
+    BATCH_SIZE = 64
+
+    def __init__(self, quantized: bool = True, cache: bool = True):
         try:
+            import torch
             from sentence_transformers import SentenceTransformer
         except ImportError:
             raise ValueError(
                 "sentence-transformers not installed. Run:\n"
                 "  pip install sentence-transformers"
             )
-        self._model = SentenceTransformer(self.MODEL_NAME, trust_remote_code=True)
-        print(f"  Nomic {self.MODEL_NAME}: loaded ({self._model.device})")
+
+        self._model = None
+        # On CPU, prefer the INT8 ONNX Runtime model (needs sentence-transformers
+        # >= 3.2 with optimum[onnxruntime]); fall back to the PyTorch model
+        if quantized and not torch.cuda.is_available():
+            try:
+                self._model = SentenceTransformer(
+                    self.MODEL_NAME,
+                    trust_remote_code=True,
+                    backend="onnx",
+                    model_kwargs={"file_name": self.ONNX_INT8_FILE},
+                )
+                self._variant = "onnx-int8"
+                print(f"  Nomic {self.MODEL_NAME}: loaded (onnxruntime int8, cpu)")
+            except Exception as e:
+                print(f"  Nomic ONNX int8 unavailable ({e}) — using PyTorch")
+
+        if self._model is None:
+            self._model = SentenceTransformer(self.MODEL_NAME, trust_remote_code=True)
+            self._variant = "torch"
+            # Half precision on GPU: outputs are L2-normalised, so fp16 costs
+            # nothing measurable in retrieval quality
+            if self._model.device.type == "cuda":
+                self._model.half()
+            print(f"  Nomic {self.MODEL_NAME}: loaded ({self._model.device})")
+
+        self._model.max_seq_length = self.MAX_SEQ_LENGTH
+
+        self._cache = None
+        if cache:
+            try:
+                self._cache = _EmbeddingCache(self.CACHE_PATH)
+            except (OSError, sqlite3.Error) as e:
+                print(f"  Nomic embedding cache disabled ({e})")
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        # encode() length-sorts the inputs before batching, so each batch is
+        # padded only to its own longest text
+        return self._model.encode(
+            texts,
+            batch_size=self.BATCH_SIZE,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
 
     def embed(self, texts: list[str]) -> list[list[float]]:
-        """Embed a list of text strings into 768-dim vectors."""
+        """Embed a list of text strings into 768-dim vectors.
+
+        Texts already in the on-disk cache are not re-encoded; only the
+        distinct misses go through the model.
+        """
         # nomic-embed-text expects "search_document: " or "search_query: " prefix
         # For general embedding, use "search_document: " prefix
         prefixed = [f"search_document: {t}" for t in texts]
-        embeddings = self._model.encode(prefixed, normalize_embeddings=True)
-        return embeddings.tolist()
+        if self._cache is None:
+            return self._encode(prefixed).tolist()
+
+        namespace = f"{self.MODEL_NAME}:{self._variant}:{self.MAX_SEQ_LENGTH}"
+        keys = [_EmbeddingCache.key(namespace, t) for t in prefixed]
+        vectors = self._cache.get_many(list(set(keys)))
+
+        misses = {k: t for k, t in zip(keys, prefixed) if k not in vectors}
+        if misses:
+            # Rounded the way the cache stores them, so a text's vector is the
+            # same whether or not it was cached
+            embeddings = self._encode(list(misses.values())).astype(np.float16).astype(np.float32)
+            self._cache.put_many(zip(misses, embeddings))
+            vectors.update(zip(misses, embeddings))
+
+        return [vectors[k].tolist() for k in keys]
 
     def embed_query(self, text: str) -> list[float]:
         """Embed a search query (uses 'search_query:' prefix for better retrieval)."""
-        embeddings = self._model.encode(
-            [f"search_query: {text}"], normalize_embeddings=True
-        )
-        return embeddings[0].tolist()
+        return self._encode([f"search_query: {text}"])[0].tolist()
 
     def embed_one(self, text: str) -> list[float]:
         """Embed a single text string."""
@@ -71,13 +183,38 @@ class NomicEmbedder:
 
 # ── CLIP image+text embeddings ──────────────────────────────────────────
 
+class _ImageDataset:
+    """Map-style dataset of preprocessed images for a torch DataLoader.
+
+    Defined at module level so DataLoader workers can pickle it.
+    """
+
+    def __init__(self, paths: list[Path], preprocess):
+        self.paths = list(paths)
+        self.preprocess = preprocess
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __getitem__(self, i):
+        from PIL import Image
+
+        with Image.open(self.paths[i]) as img:
+            return self.preprocess(img.convert("RGB"))
+
+
 class CLIPEmbedder:
     """Cross-modal embeddings using CLIP ViT-B/32.
 
     512-dim vectors for both images and text in the same space.
     Enables: "find me a diagram showing pump connections" → matching images.
+
+    Vectors are returned as float16 NumPy arrays (one row per input); they
+    are L2-normalised, so half precision is ample for cosine similarity.
     """
 
+    DIM = 512
+
     def __init__(self):
         try:
             import open_clip
@@ -98,39 +235,84 @@ class CLIPEmbedder:
         )
         self.tokenizer = open_clip.get_tokenizer("ViT-B-32")
         self.model = self.model.to(self.device).eval()
-
-    def embed_images(self, image_paths: list[Path]) -> list[list[float]]:
-        """Embed images into 512-dim CLIP vectors."""
+        # Half precision on GPU (see NomicEmbedder); CPU stays in fp32
+        self.dtype = torch.float16 if self.device == "cuda" else torch.float32
+        self.model = self.model.to(self.dtype)
+
+        # Image tower, compiled on first use (see _encode_images)
+        self._encode_image = None
+
+    def _encode_images(self, batch):
+        """Run the image tower, compiling it on the first batch.
+
+        On GPU the tower is compiled so LayerNorm/attention run as fused
+        Triton kernels; dynamic shapes let full and partial batches share one
+        graph. Compiling here rather than in __init__ keeps text-only callers
+        from paying for it. Falls back to eager if Inductor is unusable.
+        """
+        if self._encode_image is None:
+            self._encode_image = self.model.encode_image
+            if self.device == "cuda" and hasattr(self._torch, "compile"):
+                compiled = self._torch.compile(self.model.encode_image, dynamic=True)
+                try:
+                    features = compiled(batch)
+                    self._encode_image = compiled
+                    return features
+                except Exception as e:
+                    print(f"  ⚠ torch.compile unavailable for CLIP, using eager: {e}")
+        return self._encode_image(batch)
+
+    def embed_images(self, image_paths: list[Path], batch_size: int = 64) -> np.ndarray:
+        """Embed images into an (n, 512) float16 array of CLIP vectors.
+
+        Images are decoded and preprocessed by DataLoader workers while the
+        model encodes the previous batch; single small batches skip the
+        worker pool.
+        """
         import torch
+        from torch.utils.data import DataLoader
+
+        if not image_paths:
+            return np.empty((0, self.DIM), dtype=np.float16)
+
+        num_workers = 0 if len(image_paths) <= batch_size else max(1, (os.cpu_count() or 2) // 2)
+        loader = DataLoader(
+            _ImageDataset(image_paths, self.preprocess),
+            batch_size=batch_size,
+            num_workers=num_workers,
+            pin_memory=self.device == "cuda",
+        )
 
         vectors = []
-        for path in image_paths:
-            img = self._Image.open(path).convert("RGB")
-            img_tensor = self.preprocess(img).unsqueeze(0).to(self.device)
+        with torch.inference_mode():
+            for batch in loader:
+                batch = batch.to(self.device, dtype=self.dtype, non_blocking=True)
+                features = self._encode_images(batch)
+                features = torch.nn.functional.normalize(features.float(), dim=-1)
+                vectors.append(features.half().cpu().numpy())
 
-            with torch.no_grad():
-                features = self.model.encode_image(img_tensor)
-                features = features / features.norm(dim=-1, keepdim=True)
-                vectors.append(features[0].cpu().tolist())
+        return np.concatenate(vectors)
 
-        return vectors
+    def embed_images_as_list(self, image_paths: list[Path]) -> list[list[float]]:
+        """embed_images as nested lists, for JSON / MongoDB documents."""
+        return self.embed_images(image_paths).tolist()
 
-    def embed_texts(self, texts: list[str]) -> list[list[float]]:
-        """Embed text into 512-dim CLIP vectors (same space as images)."""
+    def embed_texts(self, texts: list[str]) -> np.ndarray:
+        """Embed text into an (n, 512) float16 array (same space as images)."""
         import torch
 
         tokens = self.tokenizer(texts).to(self.device)
-        with torch.no_grad():
-            features = self.model.encode_text(tokens)
+        with torch.inference_mode():
+            features = self.model.encode_text(tokens).float()
             features = features / features.norm(dim=-1, keepdim=True)
 
-        return features.cpu().tolist()
+        return features.half().cpu().numpy()
 
-    def embed_image(self, path: Path) -> list[float]:
+    def embed_image(self, path: Path) -> np.ndarray:
         """Embed a single image."""
         return self.embed_images([path])[0]
 
-    def embed_text(self, text: str) -> list[float]:
+    def embed_text(self, text: str) -> np.ndarray:
         """Embed a single text string (for image search)."""
         return self.embed_texts([text])[0]
 
@@ -185,25 +367,25 @@ class EmbeddingEngine:
 
     # ── Image embeddings (CLIP) ─────────────────────────────────────────
 
-    def embed_images(self, paths: list[Path]) -> list[list[float]]:
-        """Embed images using CLIP (512-dim). For visual indexing."""
+    def embed_images(self, paths: list[Path]) -> np.ndarray:
+        """Embed images using CLIP (512-dim, float16). For visual indexing."""
         if not self.clip:
             raise RuntimeError("CLIP embedder not available")
         return self.clip.embed_images(paths)
 
-    def embed_image(self, path: Path) -> list[float]:
+    def embed_image(self, path: Path) -> np.ndarray:
         """Embed single image using CLIP."""
         return self.embed_images([path])[0]
 
     # ── Cross-modal (CLIP text for image search) ────────────────────────
 
-    def embed_text_for_image_search(self, text: str) -> list[float]:
-        """Embed text into CLIP space (512-dim) for image retrieval."""
+    def embed_text_for_image_search(self, text: str) -> np.ndarray:
+        """Embed text into CLIP space (512-dim, float16) for image retrieval."""
         if not self.clip:
             raise RuntimeError("CLIP embedder not available")
         return self.clip.embed_text(text)
 
-    def embed_texts_for_image_search(self, texts: list[str]) -> list[list[float]]:
+    def embed_texts_for_image_search(self, texts: list[str]) -> np.ndarray:
         """Embed multiple texts into CLIP space for image retrieval."""
         if not self.clip:
             raise RuntimeError("CLIP embedder not available")
@@ -28,6 +28,7 @@ from datetime import datetime, timezone
 from pathlib import Path
 
 import numpy as np
+import pandas as pd
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 from updater._db import get_db
@@ -56,39 +57,59 @@ def _parse_lap_time(t: str | None) -> float | None:
     return None
 
 
+def _parse_lap_times(times: pd.Series) -> pd.Series:
+    """_parse_lap_time over a column; NaN where missing or unparseable."""
+    return times.map(_parse_lap_time, na_action="ignore").astype(float)
+
+
 # ── Data loaders ────────────────────────────────────────────────────────
 
+def _load(db, collection: str, fields: list[str]) -> list[dict]:
+    """Fetch only the fields the builders read, in large cursor batches."""
+    projection = {"_id": 0, **{f: 1 for f in fields}}
+    return list(db[collection].find({}, projection).batch_size(5000))
+
+
 def load_race_results(db) -> list[dict]:
-    return list(db["jolpica_race_results"].find({}, {"_id": 0}))
+    # The race stats themselves are aggregated server-side (build_race_stats)
+    return _load(db, "jolpica_race_results", [
+        "season", "constructor_id", "constructor_name", "nationality", "driver_code", "driver_id",
+    ])
 
 
 def load_qualifying(db) -> list[dict]:
-    return list(db["jolpica_qualifying"].find({}, {"_id": 0}))
+    return _load(db, "jolpica_qualifying", ["season", "constructor_id", "position", "q1", "q2", "q3"])
 
 
 def load_pit_stops(db) -> list[dict]:
-    return list(db["jolpica_pit_stops"].find({}, {"_id": 0}))
+    return _load(db, "jolpica_pit_stops", ["season", "driver_id", "duration_s"])
 
 
 def load_constructor_standings(db) -> list[dict]:
-    return list(db["jolpica_constructor_standings"].find({}, {"_id": 0}))
+    return _load(db, "jolpica_constructor_standings", [
+        "season", "constructor_id", "constructor_name", "nationality", "position", "points", "wins",
+    ])
 
 
 def load_driver_standings(db) -> list[dict]:
-    return list(db["jolpica_driver_standings"].find({}, {"_id": 0}))
+    return _load(db, "jolpica_driver_standings", [
+        "season", "constructor_id", "driver_code", "driver_name", "position", "points", "wins",
+    ])
 
 
 def load_telemetry_summaries(db) -> list[dict]:
-    return list(db["telemetry_race_summary"].find({}, {"_id": 0}))
+    return _load(db, "telemetry_race_summary", [
+        "Year", "Driver", "Race", "avg_speed", "top_speed", "avg_throttle", "brake_pct", "drs_pct",
+    ])
 
 
 # ── Builder: driver-to-constructor mapping per season ───────────────────
 
-def build_driver_constructor_map(race_results: list[dict]) -> dict:
-    """Map (season, driver_code) → constructor_id from race results."""
+def build_driver_constructor_map(race_results: list[dict], driver_field: str = "driver_code") -> dict:
+    """Map (season, driver_field) → constructor_id from race results."""
     mapping = {}
     for r in race_results:
-        key = (r.get("season"), r.get("driver_code"))
+        key = (r.get("season"), r.get(driver_field))
         if key[0] and key[1] and r.get("constructor_id"):
             mapping[key] = r["constructor_id"]
     return mapping
@@ -96,72 +117,76 @@ def build_driver_constructor_map(race_results: list[dict]) -> dict:
 
 # ── Builder: race dimension ─────────────────────────────────────────────
 
-def build_race_stats(race_results: list[dict]) -> dict:
-    """Aggregate race results per (constructor_id, season)."""
-    groups = defaultdict(list)
-    for r in race_results:
-        cid = r.get("constructor_id")
-        season = r.get("season")
-        if cid and season:
-            groups[(cid, season)].append(r)
+DNF_STATUSES = ["Retired", "Accident", "Collision", "Engine", "Gearbox",
+                "Hydraulics", "Brakes", "Suspension", "Electrical",
+                "Mechanical", "Spun off", "Withdrew", "Did not finish"]
+
+
+def _to_number(field: str, default=None) -> dict:
+    """$convert a numeric-or-string field to double; unparseable → default."""
+    return {"$convert": {"input": f"${field}", "to": "double", "onError": default, "onNull": default}}
+
+
+def _is_set_and(expr: dict, field: str) -> dict:
+    # Aggregation comparisons order null below every number, so "$lte"
+    # alone would count missing values as matches
+    return {"$cond": [{"$and": [{"$ne": [f"${field}", None]}, expr]}, 1, 0]}
+
+
+def build_race_stats(db) -> dict:
+    """Aggregate race results per (constructor_id, season) inside MongoDB.
+
+    Only one document per group comes back instead of every race result.
+    """
+    pipeline = [
+        {"$match": {
+            "constructor_id": {"$nin": [None, "", 0, False]},
+            "season": {"$nin": [None, "", 0, False]},
+        }},
+        {"$project": {
+            "constructor_id": 1,
+            "season": 1,
+            "round": {"$ifNull": ["$round", None]},
+            "position": _to_number("position"),
+            "grid": _to_number("grid"),
+            "positions_gained": _to_number("positions_gained"),
+            "points": _to_number("points", 0.0),
+            "fastest_lap_rank": _to_number("fastest_lap_rank"),
+            "is_dnf": {"$cond": [{"$in": ["$status", DNF_STATUSES]}, 1, 0]},
+        }},
+        {"$group": {
+            "_id": {"cid": "$constructor_id", "season": "$season"},
+            "total_entries": {"$sum": 1},
+            "rounds": {"$addToSet": "$round"},
+            "total_wins": {"$sum": {"$cond": [{"$eq": ["$position", 1]}, 1, 0]}},
+            "total_podiums": {"$sum": _is_set_and({"$lte": ["$position", 3]}, "position")},
+            "total_points": {"$sum": "$points"},
+            "avg_finish_position": {"$avg": "$position"},
+            "best_finish": {"$min": "$position"},
+            "dnf_count": {"$sum": "$is_dnf"},
+            "avg_grid_position": {"$avg": {"$cond": [{"$gt": ["$grid", 0]}, "$grid", None]}},
+            "avg_positions_gained": {"$avg": "$positions_gained"},
+            "fastest_lap_top3_count": {"$sum": _is_set_and({"$lte": ["$fastest_lap_rank", 3]}, "fastest_lap_rank")},
+        }},
+    ]
 
     stats = {}
-    for (cid, season), results in groups.items():
-        positions = []
-        for r in results:
-            try:
-                p = int(r["position"])
-                positions.append(p)
-            except (KeyError, TypeError, ValueError):
-                pass
-        points = [float(r.get("points", 0) or 0) for r in results]
-        dnf_statuses = {"Retired", "Accident", "Collision", "Engine", "Gearbox",
-                        "Hydraulics", "Brakes", "Suspension", "Electrical",
-                        "Mechanical", "Spun off", "Withdrew", "Did not finish"}
-        dnfs = sum(1 for r in results if r.get("status") in dnf_statuses)
-        grid_positions = []
-        for r in results:
-            try:
-                g = int(r["grid"])
-                if g > 0:
-                    grid_positions.append(g)
-            except (KeyError, TypeError, ValueError):
-                pass
-        positions_gained = []
-        for r in results:
-            try:
-                pg = float(r["positions_gained"])
-                positions_gained.append(pg)
-            except (KeyError, TypeError, ValueError):
-                pass
-
-        # Fastest lap ranks
-        fl_ranks = []
-        for r in results:
-            try:
-                flr = int(r["fastest_lap_rank"])
-                if flr <= 3:
-                    fl_ranks.append(flr)
-            except (KeyError, TypeError, ValueError):
-                pass
-
-        # Unique races
-        race_rounds = set((r.get("round"),) for r in results)
-
-        stats[(cid, season)] = {
-            "total_entries": len(results),
-            "total_races": len(race_rounds),
-            "total_wins": sum(1 for p in positions if p == 1),
-            "total_podiums": sum(1 for p in positions if p <= 3),
-            "total_points": _safe_round(sum(points), 1),
-            "avg_finish_position": _safe_round(np.mean(positions), 2) if positions else None,
-            "best_finish": min(positions) if positions else None,
+    for g in db["jolpica_race_results"].aggregate(pipeline, allowDiskUse=True):
+        entries, races, dnfs = g["total_entries"], len(g["rounds"]), g["dnf_count"]
+        stats[(g["_id"]["cid"], g["_id"]["season"])] = {
+            "total_entries": entries,
+            "total_races": races,
+            "total_wins": g["total_wins"],
+            "total_podiums": g["total_podiums"],
+            "total_points": _safe_round(g["total_points"], 1),
+            "avg_finish_position": _safe_round(g["avg_finish_position"], 2),
+            "best_finish": None if g["best_finish"] is None else int(g["best_finish"]),
             "dnf_count": dnfs,
-            "dnf_rate": _safe_round(dnfs / len(results) * 100, 1) if results else None,
-            "avg_grid_position": _safe_round(np.mean(grid_positions), 2) if grid_positions else None,
-            "avg_positions_gained": _safe_round(np.mean(positions_gained), 2) if positions_gained else None,
-            "fastest_lap_top3_count": len(fl_ranks),
-            "points_per_race": _safe_round(sum(points) / len(race_rounds), 2) if race_rounds else None,
+            "dnf_rate": _safe_round(dnfs / entries * 100, 1),
+            "avg_grid_position": _safe_round(g["avg_grid_position"], 2),
+            "avg_positions_gained": _safe_round(g["avg_positions_gained"], 2),
+            "fastest_lap_top3_count": g["fastest_lap_top3_count"],
+            "points_per_race": _safe_round(g["total_points"] / races, 2),
         }
     return stats
 
@@ -170,40 +195,51 @@ def build_race_stats(race_results: list[dict]) -> dict:
 
 def build_qualifying_stats(qualifying: list[dict]) -> dict:
     """Aggregate qualifying per (constructor_id, season)."""
-    groups = defaultdict(list)
-    for q in qualifying:
-        cid = q.get("constructor_id")
-        season = q.get("season")
-        if cid and season:
-            groups[(cid, season)].append(q)
+    cols = ["constructor_id", "season", "position", "q1", "q2", "q3"]
+    # object dtype keeps the group keys as the original Python values
+    df = pd.DataFrame(qualifying, columns=cols, dtype=object)
+    df = df[df["constructor_id"].fillna("").astype(bool) & df["season"].fillna(0).astype(bool)]
+    if df.empty:
+        return {}
+
+    position = pd.to_numeric(df["position"], errors="coerce")
+    # Best qualifying time: the latest session with a sane (> 30 s) time
+    best_time = pd.Series(np.nan, index=df.index)
+    for field in ["q1", "q2", "q3"]:
+        t = _parse_lap_times(df[field])
+        best_time = t.where(t > 30).combine_first(best_time)
+
+    per_quali = pd.DataFrame({
+        "constructor_id": df["constructor_id"],
+        "season": df["season"],
+        "position": position,
+        "in_q3": df["q3"].fillna("").astype(bool),
+        "front_row": position <= 2,
+        "pole": position == 1,
+        "best_time": best_time,
+    })
+    agg = per_quali.groupby(["constructor_id", "season"], sort=False).agg(
+        qual_entries=("position", "size"),
+        avg_qual_position=("position", "mean"),
+        best_qual_position=("position", "min"),
+        q3_appearances=("in_q3", "sum"),
+        front_row_count=("front_row", "sum"),
+        pole_count=("pole", "sum"),
+        best_qual_time_s=("best_time", "min"),
+    )
 
     stats = {}
-    for (cid, season), quals in groups.items():
-        positions = []
-        for q in quals:
-            try:
-                positions.append(int(q["position"]))
-            except (KeyError, TypeError, ValueError):
-                pass
-        q3_count = sum(1 for q in quals if q.get("q3"))
-
-        # Best qualifying times
-        best_times = []
-        for q in quals:
-            for field in ["q3", "q2", "q1"]:
-                t = _parse_lap_time(q.get(field))
-                if t and t > 30:  # sanity check
-                    best_times.append(t)
-                    break
-
-        stats[(cid, season)] = {
-            "qual_entries": len(quals),
-            "avg_qual_position": _safe_round(np.mean(positions), 2) if positions else None,
-            "best_qual_position": min(positions) if positions else None,
+    for key, row in agg.iterrows():
+        entries, q3_count = int(row["qual_entries"]), int(row["q3_appearances"])
+        stats[key] = {
+            "qual_entries": entries,
+            "avg_qual_position": _safe_round(row["avg_qual_position"], 2),
+            "best_qual_position": None if pd.isna(row["best_qual_position"]) else int(row["best_qual_position"]),
             "q3_appearances": q3_count,
-            "q3_rate": _safe_round(q3_count / len(quals) * 100, 1) if quals else None,
-            "front_row_count": sum(1 for p in positions if p <= 2),
-            "pole_count": sum(1 for p in positions if p == 1),
+            "q3_rate": _safe_round(q3_count / entries * 100, 1),
+            "front_row_count": int(row["front_row_count"]),
+            "pole_count": int(row["pole_count"]),
+            "best_qual_time_s": _safe_round(row["best_qual_time_s"], 3),
         }
     return stats
 
@@ -212,24 +248,16 @@ def build_qualifying_stats(qualifying: list[dict]) -> dict:
 
 def build_pit_stats(
     pit_stops: list[dict],
-    driver_map: dict,
+    driver_id_map: dict,
 ) -> dict:
-    """Aggregate pit stops per (constructor_id, season)."""
+    """Aggregate pit stops per (constructor_id, season).
+
+    driver_id_map is keyed by (season, driver_id), the id pit stops carry.
+    """
     groups = defaultdict(list)
     for p in pit_stops:
         season = p.get("season")
-        driver_id = p.get("driver_id")
-        # Map driver_id → constructor_id via race results
-        # pit_stops use driver_id, need to match
-        cid = None
-        # Try direct driver_code match first
-        if season and driver_id:
-            # driver_id in pit_stops is like "norris", "hamilton"
-            # We need to find constructor from race_results
-            for (s, dc), c in driver_map.items():
-                if s == season and dc and driver_id.lower() in dc.lower():
-                    cid = c
-                    break
+        cid = driver_id_map.get((season, p.get("driver_id")))
         if not cid:
             continue
         dur = p.get("duration_s")
@@ -272,7 +300,7 @@ def build_telemetry_stats(
         drs_pcts = [d["drs_pct"] for d in docs if d.get("drs_pct")]
 
         stats[(cid, season)] = {
-            "tel_race_count": len(set((d.get("Race"),) for d in docs)),
+            "tel_race_count": len({d.get("Race") for d in docs}),
             "fleet_avg_speed": _safe_round(np.mean(avg_speeds), 1) if avg_speeds else None,
             "fleet_top_speed": _safe_round(np.max(top_speeds), 1) if top_speeds else None,
             "fleet_avg_throttle": _safe_round(np.mean(throttles), 1) if throttles else None,
@@ -284,26 +312,28 @@ def build_telemetry_stats(
 
 # ── Builder: driver lineup ──────────────────────────────────────────────
 
+LINEUP_FIELDS = ["driver_code", "driver_name", "position", "points", "wins"]
+
+
+def _lineup_position(d: dict) -> float:
+    """Numeric championship position for ordering; missing/unparseable → 99."""
+    try:
+        return float(d.get("position") or 99)
+    except (TypeError, ValueError):
+        return 99.0
+
+
 def build_lineups(driver_standings: list[dict]) -> dict:
     """Get driver lineups per (constructor_id, season)."""
-    groups = defaultdict(list)
-    for d in driver_standings:
-        cid = d.get("constructor_id")
-        season = d.get("season")
-        if cid and season:
-            groups[(cid, season)].append({
-                "driver_code": d.get("driver_code"),
-                "driver_name": d.get("driver_name"),
-                "position": d.get("position"),
-                "points": d.get("points"),
-                "wins": d.get("wins"),
-            })
+    rows = [d for d in driver_standings if d.get("constructor_id") and d.get("season")]
+    # One stable sort over all rows puts every group in position order as
+    # it is filled, instead of a list.sort per group afterwards
+    rows.sort(key=_lineup_position)
 
-    lineups = {}
-    for key, drivers in groups.items():
-        drivers.sort(key=lambda x: x.get("position") or 99)
-        lineups[key] = drivers
-    return lineups
+    lineups = defaultdict(list)
+    for d in rows:
+        lineups[(d["constructor_id"], d["season"])].append({f: d.get(f) for f in LINEUP_FIELDS})
+    return dict(lineups)
 
 
 # ── Main assembly ───────────────────────────────────────────────────────
@@ -325,18 +355,19 @@ def build_profiles(db) -> list[dict]:
     print(f"    driver_standings: {len(driver_stnd)}")
     print(f"    telemetry_race_summary: {len(tel_summaries)}")
 
-    # Build driver→constructor map from race results
+    # Build driver→constructor maps from race results (pit stops carry driver_id)
     driver_map = build_driver_constructor_map(race_results)
+    driver_id_map = build_driver_constructor_map(race_results, "driver_id")
 
     # Build per-dimension stats
     print("  Computing race stats...")
-    race_stats = build_race_stats(race_results)
+    race_stats = build_race_stats(db)
 
     print("  Computing qualifying stats...")
     qual_stats = build_qualifying_stats(qualifying)
 
     print("  Computing pit stop stats...")
-    pit_stats = build_pit_stats(pit_stops, driver_map)
+    pit_stats = build_pit_stats(pit_stops, driver_id_map)
 
     print("  Computing telemetry stats...")
     tel_stats = build_telemetry_stats(tel_summaries, driver_map)
@@ -433,7 +464,14 @@ def main():
         print("  ⚠ No profiles to insert")
         return
 
-    # Upsert each profile
+    # Indexes first: each upsert below looks its profile up by
+    # (constructor_id, season), which is then an index seek, not a scan
+    db[COL_NAME].create_index([("constructor_id", 1), ("season", 1)], unique=True)
+    db[COL_NAME].create_index("season")
+    db[COL_NAME].create_index("championship_position")
+
+    # Upsert each profile; the keys are unique, so order doesn't matter and
+    # the server may apply the batch unordered
     from pymongo import UpdateOne
     ops = [
         UpdateOne(
@@ -443,14 +481,9 @@ def main():
         )
         for p in profiles
     ]
-    result = db[COL_NAME].bulk_write(ops)
+    result = db[COL_NAME].bulk_write(ops, ordered=False)
     print(f"  Upserted: {result.upserted_count}, Modified: {result.modified_count}")
 
-    # Indexes
-    db[COL_NAME].create_index([("constructor_id", 1), ("season", 1)], unique=True)
-    db[COL_NAME].create_index("season")
-    db[COL_NAME].create_index("championship_position")
-
     # Summary
     seasons = sorted(set(p["season"] for p in profiles))
     teams = sorted(set(p["constructor_id"] for p in profiles))
@@ -21,7 +21,9 @@ Usage:
 
 from __future__ import annotations
 
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 
@@ -30,113 +32,232 @@ import pandas as pd
 from pymongo import UpdateOne
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
-from data_quality_fixes import load_telemetry_from_mongo
+from data_quality_fixes import load_driver_number_map, load_telemetry_from_mongo, map_driver_numbers
 from updater._db import get_db
 
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
 
-def compute_braking_metrics(drv: pd.DataFrame) -> dict:
-    """Compute braking performance metrics for a single driver."""
-    drv = drv.sort_values("SessionTime").reset_index(drop=True)
 
-    dt = drv["SessionTime"].diff()
-    dv_kmh = drv["Speed"].diff()
-    dv_ms = dv_kmh / 3.6
+def _brake_throttle_gaps_py(brake_active: np.ndarray, throttle_active: np.ndarray, t: np.ndarray) -> np.ndarray:
+    """Gaps (s) between brake release and the next throttle application.
 
-    braking_mask = (drv["Brake"] > 0) & (dv_ms < 0) & (dt > 0) & (dt < 5)
+    Only gaps in (0, 2) s count; any non-braking sample without throttle
+    resets the search.
+    """
+    out = np.empty(len(t))
+    n = 0
+    in_brake = False
+    brake_end_time = 0.0
+    for i in range(len(t)):
+        if brake_active[i]:
+            in_brake = True
+            brake_end_time = t[i]
+        elif in_brake and throttle_active[i]:
+            gap = t[i] - brake_end_time
+            if 0 < gap < 2:
+                out[n] = gap
+                n += 1
+            in_brake = False
+        else:
+            in_brake = False
+    return out[:n]
+
+
+def _lap_window_sums_py(
+    throttle: np.ndarray, speed: np.ndarray, early: np.ndarray, late: np.ndarray,
+) -> np.ndarray:
+    """Sums and non-NaN counts of throttle and speed in the early/late lap windows.
+
+    One pass over the driver's rows; out[channel, window] = (sum, count) with
+    channel 0 = throttle, 1 = speed and window 0 = early, 1 = late.
+    """
+    out = np.zeros((2, 2, 2))
+    for i in range(len(throttle)):
+        if early[i]:
+            w = 0
+        elif late[i]:
+            w = 1
+        else:
+            continue
+        if not np.isnan(throttle[i]):
+            out[0, w, 0] += throttle[i]
+            out[0, w, 1] += 1
+        if not np.isnan(speed[i]):
+            out[1, w, 0] += speed[i]
+            out[1, w, 1] += 1
+    return out
+
+
+# Per-sample loops: compiled when numba is installed (without the GIL, so
+# drivers on the thread pool in main() run them concurrently)
+if NUMBA_AVAILABLE:
+    _brake_throttle_gaps = numba.njit(cache=True, nogil=True)(_brake_throttle_gaps_py)
+    _lap_window_sums = numba.njit(cache=True, nogil=True)(_lap_window_sums_py)
+else:
+    _brake_throttle_gaps = _brake_throttle_gaps_py
+    _lap_window_sums = _lap_window_sums_py
+
+
+def _p99(values: np.ndarray) -> float:
+    """99th percentile with linear interpolation (pandas' quantile default),
+    via an O(n) partition around the two neighbouring ranks instead of a sort."""
+    h = (len(values) - 1) * 0.99
+    lo = int(h)
+    hi = min(lo + 1, len(values) - 1)
+    part = np.partition(values, [lo, hi])
+    a, b, frac = part[lo], part[hi], h - lo
+    # Interpolate from the nearer end, as numpy's quantile does
+    return float(a + (b - a) * frac if frac < 0.5 else b - (b - a) * (1 - frac))
+
+
+def driver_arrays(drv: pd.DataFrame) -> dict[str, np.ndarray]:
+    """Raw NumPy channels and masks of one driver's block, built once and
+    shared by the compute_* functions."""
+    lap = drv["LapNumber"].to_numpy(dtype=np.float64)
+    throttle = drv["Throttle"].to_numpy(dtype=np.float64)
+    speed = drv["Speed"].to_numpy(dtype=np.float64)
+    # Early (laps 1-20) / late (lap 40+) race windows for the late-race deltas
+    early = (lap >= 1) & (lap <= 20)
+    late = lap >= 40
+    return {
+        "throttle": throttle,
+        "throttle_valid": ~np.isnan(throttle),
+        "speed": speed,
+        "speed_valid": ~np.isnan(speed),
+        "brake_active": (drv["Brake"] > 0).to_numpy(dtype=np.bool_),
+        "t": drv["SessionTime"].to_numpy(dtype=np.float64),
+        "early": early,
+        "late": late,
+        "windows": _lap_window_sums(throttle, speed, early, late),
+    }
+
+
+def compute_braking_metrics(arrs: dict, order: np.ndarray) -> dict:
+    """Compute braking performance metrics for a single driver.
+
+    ``order`` is the SessionTime ordering of the driver's rows (positions
+    within the block), precomputed for all drivers in main().
+    """
+    t = arrs["t"][order]
+    brake_active = arrs["brake_active"][order]
+
+    # Sample-to-sample deltas; element i is row i+1 minus row i
+    dt = np.diff(t)
+    dv_ms = np.diff(arrs["speed"][order]) / 3.6
+
+    braking_mask = brake_active[1:] & (dv_ms < 0) & (dt > 0) & (dt < 5)
     if braking_mask.sum() < 10:
         return {}
 
-    g_values = (dv_ms[braking_mask].abs() / dt[braking_mask]) / 9.81
-    g_values = g_values[(g_values > 0.1) & (g_values < 8)]
+    # Deceleration in g for the braking rows, computed once for both the
+    # headline stats and the lap windows
+    g_values = (np.abs(dv_ms[braking_mask]) / dt[braking_mask]) / 9.81
+    in_range = (g_values > 0.1) & (g_values < 8)
+    g_values = g_values[in_range]
 
-    if g_values.empty:
+    if len(g_values) == 0:
         return {}
 
     # Brake-to-throttle transition time
     # Find brake release → throttle application gaps
-    brake_active = drv["Brake"] > 0
-    throttle_active = drv["Throttle"] > 20
-    transitions = []
-    in_brake = False
-    brake_end_time = None
-    for i in range(len(drv)):
-        if brake_active.iloc[i]:
-            in_brake = True
-            brake_end_time = drv["SessionTime"].iloc[i]
-        elif in_brake and throttle_active.iloc[i] and brake_end_time is not None:
-            gap = drv["SessionTime"].iloc[i] - brake_end_time
-            if 0 < gap < 2:
-                transitions.append(gap)
-            in_brake = False
-        elif not brake_active.iloc[i]:
-            in_brake = False
+    transitions = _brake_throttle_gaps(brake_active, arrs["throttle"][order] > 20, t)
 
     # Late-race braking delta
-    drv_braking = drv.loc[braking_mask].copy()
-    drv_braking["g"] = (dv_ms[braking_mask].abs() / dt[braking_mask]) / 9.81
-    drv_braking = drv_braking[(drv_braking["g"] > 0.1) & (drv_braking["g"] < 8)]
-
-    early = drv_braking[drv_braking["LapNumber"].between(1, 20)]["g"]
-    late = drv_braking[drv_braking["LapNumber"] >= 40]["g"]
+    rows = np.flatnonzero(braking_mask)[in_range] + 1
+    early = g_values[arrs["early"][order][rows]]
+    late = g_values[arrs["late"][order][rows]]
     late_delta = None
     if len(early) > 10 and len(late) > 10:
         late_delta = round(float(late.mean() - early.mean()), 4)
 
     return {
         "avg_braking_g": round(float(g_values.mean()), 4),
-        "max_braking_g": round(float(g_values.quantile(0.99)), 4),
-        "braking_consistency": round(float(g_values.std()), 4),
-        "brake_to_throttle_avg_s": round(float(np.mean(transitions)), 4) if transitions else None,
+        "max_braking_g": round(_p99(g_values), 4),
+        "braking_consistency": round(float(g_values.std(ddof=1)), 4),
+        "brake_to_throttle_avg_s": round(float(transitions.mean()), 4) if len(transitions) else None,
         "late_race_braking_delta": late_delta,
     }
 
 
-def compute_throttle_metrics(drv: pd.DataFrame) -> dict:
+def driver_aggregates(tel_df: pd.DataFrame) -> pd.DataFrame:
+    """Whole-column reductions behind the throttle, speed and DRS metrics.
+
+    One groupby pass over the full frame per column instead of a Series
+    reduction per driver; indexed by Driver.
+    """
+    drivers = tel_df["Driver"]
+    g = tel_df.groupby("Driver", sort=False)
+    throttle = tel_df["Throttle"]
+    # Throttle smoothness: std of changes between consecutive non-null samples
+    valid_throttle = tel_df.loc[throttle.notna(), ["Driver", "Throttle"]]
+    throttle_diffs = valid_throttle.groupby("Driver", sort=False)["Throttle"].diff().astype(np.float64)
+
+    agg = pd.DataFrame({
+        "throttle_n": g["Throttle"].count(),
+        "throttle_mean": g["Throttle"].mean(),
+        "full_throttle_n": (throttle >= 95).groupby(drivers, sort=False).sum(),
+        "throttle_diff_std": throttle_diffs.groupby(valid_throttle["Driver"], sort=False).std(),
+        "speed_n": g["Speed"].count(),
+        "speed_mean": g["Speed"].mean(),
+    })
+    if "DRS" in tel_df.columns:
+        drs_on = tel_df["DRS"] >= 10
+        drs_off_speed = tel_df["Speed"].where((tel_df["DRS"] < 10) & (tel_df["Speed"] > 200))
+        drs_on_speed = tel_df["Speed"].where(drs_on).groupby(drivers, sort=False)
+        drs_off_speed = drs_off_speed.groupby(drivers, sort=False)
+        agg["drs_n"] = g["DRS"].count()
+        agg["drs_active_n"] = drs_on.groupby(drivers, sort=False).sum()
+        agg["drs_on_speed_n"] = drs_on_speed.count()
+        agg["drs_on_speed_mean"] = drs_on_speed.mean()
+        agg["drs_off_speed_n"] = drs_off_speed.count()
+        agg["drs_off_speed_mean"] = drs_off_speed.mean()
+    return agg
+
+
+def compute_throttle_metrics(arrs: dict, agg: dict) -> dict:
     """Compute throttle application metrics."""
-    throttle = drv["Throttle"].dropna()
-    if len(throttle) < 100:
+    if agg["throttle_n"] < 100:
         return {}
 
-    full_throttle_mask = throttle >= 95
-    full_throttle_ratio = full_throttle_mask.sum() / len(throttle)
+    full_throttle_ratio = agg["full_throttle_n"] / agg["throttle_n"]
 
     # Throttle smoothness: std of throttle changes (lower = smoother)
-    throttle_diffs = throttle.diff().dropna()
-    smoothness = float(throttle_diffs.std())
+    smoothness = float(agg["throttle_diff_std"])
 
     # Late race throttle comparison
-    early_throttle = drv.loc[drv["LapNumber"].between(1, 20), "Throttle"].dropna()
-    late_throttle = drv.loc[drv["LapNumber"] >= 40, "Throttle"].dropna()
+    (early_sum, n_early), (late_sum, n_late) = arrs["windows"][0]
     late_delta = None
-    if len(early_throttle) > 100 and len(late_throttle) > 100:
-        late_delta = round(float(late_throttle.mean() - early_throttle.mean()), 4)
+    if n_early > 100 and n_late > 100:
+        late_delta = round(float(late_sum / n_late - early_sum / n_early), 4)
 
     return {
-        "avg_throttle_pct": round(float(throttle.mean()), 2),
+        "avg_throttle_pct": round(float(agg["throttle_mean"]), 2),
         "full_throttle_ratio": round(float(full_throttle_ratio), 4),
         "throttle_smoothness": round(smoothness, 4),
         "late_race_throttle_delta": late_delta,
     }
 
 
-def compute_speed_metrics(drv: pd.DataFrame) -> dict:
+def compute_speed_metrics(arrs: dict, agg: dict) -> dict:
     """Compute speed-related metrics."""
-    speed = drv["Speed"].dropna()
-    if len(speed) < 100:
+    if agg["speed_n"] < 100:
         return {}
 
     # Top speed: 99th percentile (avoids sensor spikes)
-    top_speed = float(speed.quantile(0.99))
+    top_speed = _p99(arrs["speed"][arrs["speed_valid"]])
 
     # Average race speed
-    avg_speed = float(speed.mean())
+    avg_speed = float(agg["speed_mean"])
 
     # Late race speed drop
-    early_speed = drv.loc[drv["LapNumber"].between(1, 20), "Speed"].dropna()
-    late_speed = drv.loc[drv["LapNumber"] >= 40, "Speed"].dropna()
+    (early_sum, n_early), (late_sum, n_late) = arrs["windows"][1]
     late_drop = None
-    if len(early_speed) > 100 and len(late_speed) > 100:
-        late_drop = round(float(late_speed.mean() - early_speed.mean()), 2)
+    if n_early > 100 and n_late > 100:
+        late_drop = round(float(late_sum / n_late - early_sum / n_early), 2)
 
     return {
         "top_speed_kmh": round(top_speed, 1),
@@ -145,25 +266,21 @@ def compute_speed_metrics(drv: pd.DataFrame) -> dict:
     }
 
 
-def compute_drs_metrics(drv: pd.DataFrame) -> dict:
+def compute_drs_metrics(agg: dict) -> dict:
     """Compute DRS usage metrics."""
-    if "DRS" not in drv.columns:
+    if "drs_n" not in agg:
         return {}
 
-    drs = drv["DRS"].dropna()
-    if len(drs) < 100:
+    if agg["drs_n"] < 100:
         return {}
 
     # DRS values: 0-1 = off, 10-14 = enabled/active (varies by source)
-    drs_active = (drs >= 10).sum()
-    drs_ratio = drs_active / len(drs)
+    drs_ratio = agg["drs_active_n"] / agg["drs_n"]
 
-    # Speed with DRS vs without
-    drs_on = drv.loc[drv["DRS"] >= 10, "Speed"].dropna()
-    drs_off = drv.loc[(drv["DRS"] < 10) & (drv["Speed"] > 200), "Speed"].dropna()
+    # Speed with DRS vs without (above 200 km/h)
     drs_speed_gain = None
-    if len(drs_on) > 50 and len(drs_off) > 50:
-        drs_speed_gain = round(float(drs_on.mean() - drs_off.mean()), 1)
+    if agg["drs_on_speed_n"] > 50 and agg["drs_off_speed_n"] > 50:
+        drs_speed_gain = round(float(agg["drs_on_speed_mean"] - agg["drs_off_speed_mean"]), 1)
 
     return {
         "drs_usage_ratio": round(float(drs_ratio), 4),
@@ -202,25 +319,25 @@ def compute_gear_metrics(drv: pd.DataFrame) -> dict:
     }
 
 
-def compute_wet_dry_delta(drv: pd.DataFrame) -> dict:
+def compute_wet_dry_delta(drv: pd.DataFrame, arrs: dict) -> dict:
     """Compare driving style in wet vs dry conditions using TrackStatus."""
     if "TrackStatus" not in drv.columns:
         return {}
 
     # TrackStatus: "1" = green, "2" = yellow, "3" = SC, "4" = VSC, "5" = red, "6" = wet
-    wet_mask = drv["TrackStatus"].astype(str).str.contains("6", na=False)
-    dry_mask = drv["TrackStatus"].astype(str).isin(["1", ""])
-
-    wet = drv.loc[wet_mask]
-    dry = drv.loc[dry_mask]
+    status = drv["TrackStatus"].astype(str)
+    wet_mask = status.str.contains("6", na=False).to_numpy(dtype=np.bool_)
+    dry_mask = status.isin(["1", ""]).to_numpy(dtype=np.bool_)
 
-    if len(wet) < 100 or len(dry) < 100:
+    n_wet, n_dry = int(wet_mask.sum()), int(dry_mask.sum())
+    if n_wet < 100 or n_dry < 100:
         return {}
 
-    wet_throttle = wet["Throttle"].mean()
-    dry_throttle = dry["Throttle"].mean()
-    wet_brake_ratio = (wet["Brake"] > 0).sum() / len(wet)
-    dry_brake_ratio = (dry["Brake"] > 0).sum() / len(dry)
+    throttle, valid = arrs["throttle"], arrs["throttle_valid"]
+    wet_throttle = throttle[wet_mask & valid].mean()
+    dry_throttle = throttle[dry_mask & valid].mean()
+    wet_brake_ratio = arrs["brake_active"][wet_mask].sum() / n_wet
+    dry_brake_ratio = arrs["brake_active"][dry_mask].sum() / n_dry
 
     return {
         "wet_throttle_delta": round(float(wet_throttle - dry_throttle), 2),
@@ -228,6 +345,39 @@ def compute_wet_dry_delta(drv: pd.DataFrame) -> dict:
     }
 
 
+# Bounded sensor channels: float32 holds them exactly (integer km/h, %, rpm,
+# gear, DRS state and lap number) at half the memory of float64
+SENSOR_COLUMNS = ["Speed", "Throttle", "DRS", "nGear", "RPM", "LapNumber"]
+
+
+def downcast_telemetry(tel_df: pd.DataFrame) -> pd.DataFrame:
+    """Shrink the numeric sensor columns to float32 in place.
+
+    SessionTime stays float64: second offsets over a whole session need the
+    precision for the braking dt. Brake keeps its boolean dtype.
+    """
+    for col in SENSOR_COLUMNS:
+        if col in tel_df.columns and pd.api.types.is_numeric_dtype(tel_df[col]) \
+                and not pd.api.types.is_bool_dtype(tel_df[col]):
+            tel_df[col] = pd.to_numeric(tel_df[col], downcast="float")
+    return tel_df
+
+
+def compute_driver_profile(driver_code: str, drv: pd.DataFrame, agg: dict, order: np.ndarray) -> dict:
+    """All metric groups for one driver's telemetry block."""
+    metrics = {"driver_code": driver_code, "sample_count": len(drv)}
+
+    arrs = driver_arrays(drv)
+
+    metrics.update(compute_braking_metrics(arrs, order))
+    metrics.update(compute_throttle_metrics(arrs, agg))
+    metrics.update(compute_speed_metrics(arrs, agg))
+    metrics.update(compute_drs_metrics(agg))
+    metrics.update(compute_gear_metrics(drv))
+    metrics.update(compute_wet_dry_delta(drv, arrs))
+    return metrics
+
+
 def main():
     db = get_db()
     print("✅ Connected to MongoDB")
@@ -245,46 +395,52 @@ def main():
         print("  ⚠ No telemetry data found")
         return
 
+    tel_df = downcast_telemetry(tel_df)
     print(f"  Loaded {len(tel_df):,} rows, {tel_df['Driver'].nunique()} drivers")
 
-    # Build driver number → code mapping
-    num_to_code = {}
-    for doc in db["openf1_drivers"].find({}, {"driver_number": 1, "name_acronym": 1, "_id": 0}):
-        num_to_code[str(doc["driver_number"])] = doc["name_acronym"]
-
-    tel_df["Driver"] = tel_df["Driver"].map(num_to_code)
+    # Category codes for the groupbys below
+    tel_df["Driver"] = map_driver_numbers(tel_df["Driver"], load_driver_number_map(db))
     tel_df = tel_df.dropna(subset=["Driver"])
     print(f"  After mapping: {tel_df['Driver'].nunique()} drivers with known codes")
 
-    drivers = sorted(tel_df["Driver"].unique())
-    ops = []
+    # One stable sort makes each driver a contiguous block (keeping the
+    # per-driver row order) so the loop slices views instead of rescanning
+    # the whole frame with a boolean mask per driver
+    tel_df = tel_df.sort_values("Driver", kind="stable", ignore_index=True)
+    codes = tel_df["Driver"].cat.codes.to_numpy()
+    drivers = tel_df["Driver"].cat.categories
+    starts = np.searchsorted(codes, np.arange(len(drivers)))
+    ends = np.searchsorted(codes, np.arange(len(drivers)), side="right")
+    # SessionTime order within every block from one global sort, for the
+    # braking metrics; the frame itself keeps load order for the diff-based
+    # throttle and gear metrics
+    time_order = np.lexsort((tel_df["SessionTime"].to_numpy(), codes))
+    aggregates = driver_aggregates(tel_df).to_dict("index")
+    blocks = [(code, lo, hi) for code, lo, hi in zip(drivers, starts, ends) if hi - lo >= 1000]
     now = datetime.now(timezone.utc)
 
-    for i, driver_code in enumerate(drivers):
-        drv = tel_df[tel_df["Driver"] == driver_code].copy()
-        if len(drv) < 1000:
-            continue
-
-        metrics = {"driver_code": driver_code, "sample_count": len(drv)}
-
-        # Compute all metric groups
-        metrics.update(compute_braking_metrics(drv))
-        metrics.update(compute_throttle_metrics(drv))
-        metrics.update(compute_speed_metrics(drv))
-        metrics.update(compute_drs_metrics(drv))
-        metrics.update(compute_gear_metrics(drv))
-        metrics.update(compute_wet_dry_delta(drv))
-
-        metrics["updated_at"] = now
-
-        ops.append(UpdateOne(
-            {"driver_code": driver_code},
-            {"$set": metrics},
-            upsert=True,
-        ))
-
-        if (i + 1) % 10 == 0:
-            print(f"  Processed {i + 1}/{len(drivers)} drivers...")
+    # Drivers are independent and the work is pandas/NumPy/numba kernels that
+    # release the GIL, so a thread pool overlaps them on read-only views of
+    # tel_df without pickling each driver's block to a worker process
+    with ThreadPoolExecutor(max_workers=max(1, min(len(blocks), os.cpu_count() or 1))) as executor:
+        futures = [
+            executor.submit(
+                compute_driver_profile, code, tel_df.iloc[lo:hi], aggregates[code], time_order[lo:hi] - lo,
+            )
+            for code, lo, hi in blocks
+        ]
+        ops = []
+        for i, future in enumerate(futures):
+            metrics = future.result()
+            metrics["updated_at"] = now
+            ops.append(UpdateOne(
+                {"driver_code": metrics["driver_code"]},
+                {"$set": metrics},
+                upsert=True,
+            ))
+
+            if (i + 1) % 10 == 0:
+                print(f"  Processed {i + 1}/{len(blocks)} drivers...")
 
     if ops:
         db["driver_telemetry_profiles"].create_index("driver_code", unique=True)
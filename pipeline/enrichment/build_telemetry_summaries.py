@@ -16,117 +16,211 @@ Usage:
 
 from __future__ import annotations
 
-import gzip
-import pickle
 import sys
 from datetime import datetime, timezone
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
-from pymongo import UpdateOne
+from pymongo import InsertOne, UpdateOne
+from pymongo.write_concern import WriteConcern
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from data_quality_fixes import (
+    load_driver_number_map, load_telemetry_from_mongo, map_driver_numbers, parallel_bulk_write,
+)
 from updater._db import get_db
 
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Narrowed after loading; LapTime_s stays float64 for timing precision, and
+# the small integer columns stay float so missing values remain NaN
+FLOAT32_COLUMNS = ["Speed", "RPM", "Throttle", "LapNumber", "TyreLife", "Stint"]
+
+# Cleaned race telemetry from the last run, reused while its version matches
+RACE_TELEMETRY_SCRATCH = Path(__file__).resolve().parents[1] / "output" / "race_telemetry.parquet"
+
 
 def load_race_telemetry(db) -> pd.DataFrame:
-    """Load race telemetry from telemetry_compressed."""
-    filenames = sorted(db["telemetry_compressed"].distinct("filename"))
-    race_files = [f for f in filenames if "_R." in f]
-
-    # Build driver number → code mapping
-    num_to_code = {}
-    for doc in db["openf1_drivers"].find({}, {"driver_number": 1, "name_acronym": 1, "_id": 0}):
-        num_to_code[str(doc["driver_number"])] = doc["name_acronym"]
-
-    frames = []
-    for fi, fname in enumerate(race_files):
-        chunks = list(db["telemetry_compressed"].find(
-            {"filename": fname},
-            {"data": 1, "chunk": 1, "_id": 0},
-        ))
-        chunks.sort(key=lambda d: d.get("chunk", 0))
-
-        for doc in chunks:
-            try:
-                df = pickle.loads(gzip.decompress(doc["data"]))
-                frames.append(df)
-            except Exception:
-                pass
-
-        if (fi + 1) % 10 == 0:
-            print(f"  [{fi + 1}/{len(race_files)}] loaded...")
-
-    if not frames:
-        return pd.DataFrame()
-
-    tel = pd.concat(frames, ignore_index=True)
-    tel["Driver"] = tel["Driver"].astype(str).map(num_to_code)
+    """Load race telemetry from telemetry_compressed.
+
+    Chunks are decompressed on a process pool by load_telemetry_from_mongo
+    (or read from the Parquet cache when it is built).
+    """
+    tel = load_telemetry_from_mongo(db, session_filter="R")
+    if tel.empty:
+        return tel
+
+    tel["Driver"] = map_driver_numbers(tel["Driver"], load_driver_number_map(db))
     tel = tel.dropna(subset=["Driver"])
+
+    # Integer category codes instead of per-row string hashing in the groupbys
+    for col in ("Race", "Compound"):
+        if col in tel.columns:
+            tel[col] = tel[col].astype("category")
+    tel["Year"] = pd.to_numeric(tel["Year"], downcast="integer")
+    # Half-width sensor/lap columns halve the bytes every groupby pass reads
+    for col in FLOAT32_COLUMNS:
+        if col in tel.columns:
+            tel[col] = pd.to_numeric(tel[col], errors="coerce").astype(np.float32)
+    return tel
+
+
+def _telemetry_version(db) -> str:
+    """Tag that changes whenever telemetry chunks or driver numbers change."""
+    last = db["telemetry_compressed"].find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    return ":".join([
+        str(db["telemetry_compressed"].estimated_document_count()),
+        str(last["_id"]) if last else "",
+        str(db["openf1_drivers"].estimated_document_count()),
+    ])
+
+
+def load_race_telemetry_cached(db, path: Path = RACE_TELEMETRY_SCRATCH) -> pd.DataFrame:
+    """load_race_telemetry(), skipped when the scratch Parquet copy is current.
+
+    The cleaned frame is written with its version tag in the file's schema
+    metadata; re-runs over unchanged telemetry read it back instead of
+    decoding and remapping every chunk again.
+    """
+    if not PYARROW_AVAILABLE:
+        return load_race_telemetry(db)
+
+    version = _telemetry_version(db).encode()
+    if path.exists() and (pq.read_schema(path).metadata or {}).get(b"telemetry_version") == version:
+        print(f"  Reusing {path.name} (telemetry unchanged)")
+        return pq.read_table(path).to_pandas()
+
+    tel = load_race_telemetry(db)
+    if not tel.empty:
+        table = pa.Table.from_pandas(tel, preserve_index=False)
+        table = table.replace_schema_metadata({**table.schema.metadata, b"telemetry_version": version})
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        pq.write_table(table, tmp_path, compression="zstd", row_group_size=1_000_000)
+        tmp_path.replace(path)
     return tel
 
 
-def build_lap_summaries(tel: pd.DataFrame, db) -> int:
+LAP_KEYS = ["Driver", "Year", "Race", "LapNumber"]
+
+
+def _source_files(year: pd.Series, race: pd.Series) -> pd.Series:
+    """'{Year}_{Race_Name}_Race.csv' for every row.
+
+    The name is formatted once per distinct (Year, Race) pair and gathered
+    to the rows by factorized code.
+    """
+    codes, pairs = pd.MultiIndex.from_arrays([year, race]).factorize()
+    names = np.array([f"{int(y)}_{str(r).replace(' ', '_')}_Race.csv" for y, r in pairs], dtype=object)
+    return pd.Series(names[codes], index=year.index)
+
+
+def aggregate_laps(tel: pd.DataFrame) -> pd.DataFrame:
+    """One row of per-lap reductions per (Driver, Year, Race, LapNumber).
+
+    This is the only full groupby pass over the raw telemetry: the lap
+    documents come straight from it and the race summaries roll it up.
+    Samples with a missing LapNumber form their own rows so the race
+    totals still count them; lap documents skip those rows.
+    """
+    # Every per-lap reduction is one columnar groupby call
+    grouped = tel.groupby(LAP_KEYS, observed=True, sort=False, dropna=False)
+    laps = grouped.size().rename("sample_count").to_frame()
+    for col in ("Speed", "RPM", "Throttle"):
+        if col in tel.columns:
+            laps[f"{col}_n"] = grouped[col].count()
+            # Totals are carried in float64 for the race roll-up
+            laps[f"{col}_sum"] = grouped[col].sum().astype(np.float64)
+    if "Speed" in tel.columns:
+        laps["top_speed"] = grouped["Speed"].max()
+    # Lap time and date come from each lap's first sample, even when null
+    for col in ("LapTime_s", "Date"):
+        if col in tel.columns:
+            laps[col] = grouped[col].first(skipna=False)
+    if "Compound" in tel.columns:
+        laps["Compound"] = grouped["Compound"].first()
+    if "TyreLife" in tel.columns:
+        laps["TyreLife"] = grouped["TyreLife"].min()
+    if "Stint" in tel.columns:
+        laps["Stint"] = grouped["Stint"].first()
+
+    # Brake/DRS shares as summed per-row flags
+    flags = tel[LAP_KEYS].copy()
+    if "Brake" in tel.columns:
+        flags["brake_on"] = tel["Brake"].astype(bool)
+    if "DRS" in tel.columns:
+        drs = pd.to_numeric(tel["DRS"], errors="coerce")
+        flags["drs_n"] = drs.notna()
+        flags["drs_on"] = drs >= 10
+    if len(flags.columns) > len(LAP_KEYS):
+        laps = laps.join(flags.groupby(LAP_KEYS, observed=True, sort=False, dropna=False).sum())
+    return laps.reset_index()
+
+
+def build_lap_summaries(laps: pd.DataFrame, db) -> int:
     """Build telemetry_lap_summary: per-driver per-race per-lap stats."""
     print("\n  Building lap summaries...")
 
-    # Generate _source_file
-    tel["_source_file"] = tel.apply(
-        lambda r: f"{int(r['Year'])}_{str(r['Race']).replace(' ', '_')}_Race.csv", axis=1
-    )
-    source_files = sorted(tel["_source_file"].unique())
-
-    grouped = tel.groupby(["Driver", "Year", "Race", "LapNumber"])
+    laps = laps.dropna(subset=LAP_KEYS)
+    if "Speed_n" in laps.columns:
+        laps = laps.assign(avg_speed=laps["Speed_sum"] / laps["Speed_n"])
+    # Built per lap rather than per telemetry row
+    laps = laps.assign(_source_file=_source_files(laps["Year"], laps["Race"]))
 
     lap_docs = []
-    for (driver, year, race, lap_num), grp in grouped:
+    for lap in laps.to_dict("records"):
         doc = {
-            "Driver": driver,
-            "Year": int(year),
-            "Race": race,
-            "LapNumber": int(lap_num),
-            "top_speed": round(float(grp["Speed"].max()), 1) if "Speed" in grp.columns else None,
-            "avg_speed": round(float(grp["Speed"].mean()), 1) if "Speed" in grp.columns else None,
-            "_source_file": f"{int(year)}_{race.replace(' ', '_')}_Race.csv",
+            "Driver": lap["Driver"],
+            "Year": int(lap["Year"]),
+            "Race": lap["Race"],
+            "LapNumber": int(lap["LapNumber"]),
+            "top_speed": round(float(lap["top_speed"]), 1) if "top_speed" in lap else None,
+            "avg_speed": round(float(lap["avg_speed"]), 1) if "avg_speed" in lap else None,
+            "_source_file": lap["_source_file"],
         }
 
-        if "LapTime_s" in grp.columns:
-            lt = grp["LapTime_s"].iloc[0]
+        if "LapTime_s" in lap:
+            lt = lap["LapTime_s"]
             if pd.notna(lt):
                 m, s = divmod(float(lt), 60)
                 doc["LapTime"] = f"0 days 00:{int(m):02d}:{s:06.3f}"
                 doc["LapTime_s"] = round(float(lt), 3)
 
-        if "Date" in grp.columns:
-            doc["Date"] = str(grp["Date"].iloc[0])
+        if "Date" in lap:
+            doc["Date"] = str(lap["Date"])
 
-        if "Compound" in grp.columns:
-            compounds = grp["Compound"].dropna().unique()
-            doc["Compound"] = str(compounds[0]) if len(compounds) > 0 else None
+        if "Compound" in lap:
+            doc["Compound"] = str(lap["Compound"]) if pd.notna(lap["Compound"]) else None
 
-        if "TyreLife" in grp.columns:
-            tl = grp["TyreLife"].dropna()
-            doc["TyreLife"] = int(tl.min()) if len(tl) > 0 else None
+        if "TyreLife" in lap:
+            doc["TyreLife"] = int(lap["TyreLife"]) if pd.notna(lap["TyreLife"]) else None
 
-        if "Stint" in grp.columns:
-            st = grp["Stint"].dropna()
-            doc["Stint"] = int(st.iloc[0]) if len(st) > 0 else None
+        if "Stint" in lap:
+            doc["Stint"] = int(lap["Stint"]) if pd.notna(lap["Stint"]) else None
 
-        doc["sample_count"] = len(grp)
+        doc["sample_count"] = int(lap["sample_count"])
         lap_docs.append(doc)
 
-        if len(lap_docs) % 50000 == 0:
-            print(f"    {len(lap_docs):,} laps processed...")
-
     print(f"  Total: {len(lap_docs):,} lap summaries")
 
     if lap_docs:
-        db["telemetry_lap_summary"].drop()
-        # Insert in batches
-        BATCH = 10000
-        for i in range(0, len(lap_docs), BATCH):
-            db["telemetry_lap_summary"].insert_many(lap_docs[i:i + BATCH])
+        # A one-shot rebuild of a derived collection: unordered batches sent
+        # concurrently, acknowledged by the primary only
+        coll = db.get_collection("telemetry_lap_summary", write_concern=WriteConcern(w=1))
+        coll.drop()
+        parallel_bulk_write(coll, [InsertOne(doc) for doc in lap_docs], chunk_size=50_000)
 
         db["telemetry_lap_summary"].create_index("_source_file")
         db["telemetry_lap_summary"].create_index([("Driver", 1), ("Year", 1), ("Race", 1)])
@@ -135,51 +229,105 @@ def build_lap_summaries(tel: pd.DataFrame, db) -> int:
     return len(lap_docs)
 
 
-def build_race_summaries(tel: pd.DataFrame, db) -> int:
-    """Build telemetry_race_summary: per-driver per-race car/biometric stats."""
+RACE_KEYS = ["Driver", "Year", "Race"]
+
+
+def _group_p99_py(values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """99th percentile (linear interpolation, NaN skipped) of each
+    values[starts[g]:ends[g]] run; NaN where a run has no valid samples."""
+    out = np.full(len(starts), np.nan)
+    for g in range(len(starts)):
+        block = values[starts[g]:ends[g]]
+        block = block[~np.isnan(block)]
+        if len(block) == 0:
+            continue
+        h = (len(block) - 1) * 0.99
+        lo = int(h)
+        hi = min(lo + 1, len(block) - 1)
+        part = np.partition(block, np.array([lo, hi]))
+        a, b, frac = part[lo], part[hi], h - lo
+        # Interpolate from the nearer end, as numpy's quantile does
+        out[g] = a + (b - a) * frac if frac < 0.5 else b - (b - a) * (1 - frac)
+    return out
+
+
+if NUMBA_AVAILABLE:
+    _group_p99 = numba.njit(cache=True, nogil=True)(_group_p99_py)
+else:
+    _group_p99 = _group_p99_py
+
+
+def build_race_summaries(tel: pd.DataFrame, laps: pd.DataFrame, db) -> int:
+    """Build telemetry_race_summary: per-driver per-race car/biometric stats.
+
+    Counts, sums and flag totals are rolled up from the per-lap frame; only
+    the 99th percentiles and the compound lists read the raw telemetry.
+    """
     print("\n  Building race summaries...")
 
-    grouped = tel.groupby(["Driver", "Year", "Race"])
+    sum_cols = [c for c in laps.columns if c == "sample_count" or c.endswith(("_n", "_sum", "_on"))]
+    races = (laps.groupby(RACE_KEYS, observed=True, sort=False)[sum_cols].sum()
+             .rename(columns={"sample_count": "samples"}))
+    for col in ("Speed", "RPM", "Throttle"):
+        if f"{col}_n" in races.columns:
+            races[f"{col}_mean"] = races[f"{col}_sum"] / races[f"{col}_n"]
+
+    # 99th percentiles: rows are ordered by group once, then every group is
+    # a contiguous run that the kernel partitions
+    p99_cols = [col for col in ("Speed", "RPM") if col in tel.columns]
+    if p99_cols:
+        grouped = tel.groupby(RACE_KEYS, observed=True, sort=False)
+        group_keys = grouped.size().index
+        group_ids = grouped.ngroup().to_numpy(dtype=np.float64)
+        rows = np.flatnonzero(~np.isnan(group_ids))
+        group_ids = group_ids[rows].astype(np.int64)
+        order = rows[np.argsort(group_ids, kind="stable")]
+        counts = np.bincount(group_ids, minlength=len(group_keys))
+        ends = np.cumsum(counts)
+        starts = ends - counts
+        for col in p99_cols:
+            values = tel[col].to_numpy(dtype=np.float64)[order]
+            races[f"{col}_p99"] = pd.Series(_group_p99(values, starts, ends), index=group_keys)
+
+    if "Compound" in tel.columns:
+        used = (tel[RACE_KEYS + ["Compound"]].dropna(subset=["Compound"])
+                .drop_duplicates().astype({"Compound": object}))
+        races["compounds"] = used.groupby(RACE_KEYS, observed=True)["Compound"].agg(
+            lambda c: sorted(c.tolist())
+        )
+
+    races = races.reset_index()
+    races["_source_file"] = _source_files(races["Year"], races["Race"])
 
     race_docs = []
-    for (driver, year, race), grp in grouped:
-        speed = grp["Speed"].dropna() if "Speed" in grp.columns else pd.Series(dtype=float)
-        rpm = grp["RPM"].dropna() if "RPM" in grp.columns else pd.Series(dtype=float)
-        throttle = grp["Throttle"].dropna() if "Throttle" in grp.columns else pd.Series(dtype=float)
-        brake = grp["Brake"] if "Brake" in grp.columns else pd.Series(dtype=bool)
-        drs = grp["DRS"] if "DRS" in grp.columns else pd.Series(dtype=int)
-
+    for race in races.to_dict("records"):
         doc = {
-            "Driver": driver,
-            "Year": int(year),
-            "Race": race,
-            "samples": len(grp),
-            "_source_file": f"{int(year)}_{race.replace(' ', '_')}_Race.csv",
+            "Driver": race["Driver"],
+            "Year": int(race["Year"]),
+            "Race": race["Race"],
+            "samples": int(race["samples"]),
+            "_source_file": race["_source_file"],
         }
 
-        if len(speed) > 0:
-            doc["avg_speed"] = round(float(speed.mean()), 1)
-            doc["top_speed"] = round(float(speed.quantile(0.99)), 1)
+        if race.get("Speed_n", 0) > 0:
+            doc["avg_speed"] = round(float(race["Speed_mean"]), 1)
+            doc["top_speed"] = round(float(race["Speed_p99"]), 1)
 
-        if len(rpm) > 0:
-            doc["avg_rpm"] = round(float(rpm.mean()), 0)
-            doc["max_rpm"] = round(float(rpm.quantile(0.99)), 0)
+        if race.get("RPM_n", 0) > 0:
+            doc["avg_rpm"] = round(float(race["RPM_mean"]), 0)
+            doc["max_rpm"] = round(float(race["RPM_p99"]), 0)
 
-        if len(throttle) > 0:
-            doc["avg_throttle"] = round(float(throttle.mean()), 1)
+        if race.get("Throttle_n", 0) > 0:
+            doc["avg_throttle"] = round(float(race["Throttle_mean"]), 1)
 
-        if len(brake) > 0:
-            brake_bool = brake.astype(bool) if brake.dtype != bool else brake
-            doc["brake_pct"] = round(float(brake_bool.sum() / len(brake_bool) * 100), 1)
+        if "brake_on" in race:
+            doc["brake_pct"] = round(float(race["brake_on"] / race["samples"] * 100), 1)
 
-        if len(drs) > 0:
-            drs_num = pd.to_numeric(drs, errors="coerce").dropna()
-            if len(drs_num) > 0:
-                doc["drs_pct"] = round(float((drs_num >= 10).sum() / len(drs_num) * 100), 1)
+        if race.get("drs_n", 0) > 0:
+            doc["drs_pct"] = round(float(race["drs_on"] / race["drs_n"] * 100), 1)
 
-        if "Compound" in grp.columns:
-            compounds = sorted(grp["Compound"].dropna().unique().tolist())
-            doc["compounds"] = compounds
+        if "compounds" in race:
+            doc["compounds"] = race["compounds"] if isinstance(race["compounds"], list) else []
 
         race_docs.append(doc)
 
@@ -204,7 +352,7 @@ def main():
         return
 
     print(f"\nLoading race telemetry from {count} compressed chunks...")
-    tel = load_race_telemetry(db)
+    tel = load_race_telemetry_cached(db)
 
     if tel.empty:
         print("  ⚠ No race telemetry found")
@@ -213,8 +361,9 @@ def main():
     print(f"  Loaded {len(tel):,} rows, {tel['Driver'].nunique()} drivers")
     now = datetime.now(timezone.utc)
 
-    lap_count = build_lap_summaries(tel, db)
-    race_count = build_race_summaries(tel, db)
+    laps = aggregate_laps(tel)
+    lap_count = build_lap_summaries(laps, db)
+    race_count = build_race_summaries(tel, laps, db)
 
     # Stats
     print(f"\n✅ Pre-aggregation complete:")
@@ -15,8 +15,10 @@ from __future__ import annotations
 
 import math
 import sys
+import threading
 import time
-from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 import requests
@@ -25,9 +27,23 @@ from pymongo import UpdateOne
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 from updater._db import get_db
 
+try:
+    import requests_cache
+    REQUESTS_CACHE_AVAILABLE = True
+except ImportError:
+    REQUESTS_CACHE_AVAILABLE = False
+
 ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
 ELEVATION_URL = "https://api.open-meteo.com/v1/elevation"
 
+# Archive/elevation responses for a given URL don't change, so re-runs are
+# served from a local SQLite cache when requests-cache is installed
+HTTP_CACHE_PATH = Path(__file__).resolve().parents[1] / "output" / "openmeteo_cache.sqlite"
+HTTP_CACHE_TTL = timedelta(days=30)
+
+# Concurrent archive requests in main()
+WEATHER_WORKERS = 8
+
 # Circuit GPS coordinates (lat, lon)
 CIRCUIT_COORDS = {
     "albert_park": (-37.8497, 144.9680),
@@ -119,16 +135,49 @@ def air_density(temp_c: float, rh_pct: float, pressure_hpa: float) -> float:
 SEA_LEVEL_DENSITY = 1.225  # kg/m3 standard
 
 
-def fetch_race_day_weather(lat: float, lon: float, date: str) -> dict | None:
+def http_session() -> requests.Session:
+    """Session for the Open-Meteo calls, cached on disk when possible."""
+    if REQUESTS_CACHE_AVAILABLE:
+        HTTP_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        return requests_cache.CachedSession(
+            str(HTTP_CACHE_PATH), backend="sqlite", expire_after=HTTP_CACHE_TTL,
+        )
+    return requests.Session()
+
+
+_pace_lock = threading.Lock()
+_next_slot = 0.0
+
+
+def _paced_get(session, url: str, params: dict, timeout: float, pause: float) -> requests.Response:
+    """GET, then wait so network responses are `pause` seconds apart.
+
+    The spacing is shared by all threads; cache hits don't count against the
+    Open-Meteo rate limit and return immediately.
+    """
+    global _next_slot
+    resp = session.get(url, params=params, timeout=timeout)
+    if getattr(resp, "from_cache", False):
+        return resp
+    with _pace_lock:
+        now = time.monotonic()
+        wait = _next_slot - now
+        _next_slot = max(now, _next_slot) + pause
+    if wait > 0:
+        time.sleep(wait)
+    return resp
+
+
+def fetch_race_day_weather(lat: float, lon: float, date: str, session=requests) -> dict | None:
     """Fetch hourly weather from Open-Meteo archive for a specific date."""
     try:
-        resp = requests.get(ARCHIVE_URL, params={
+        resp = _paced_get(session, ARCHIVE_URL, params={
             "latitude": lat,
             "longitude": lon,
             "start_date": date,
             "end_date": date,
             "hourly": "temperature_2m,relative_humidity_2m,surface_pressure",
-        }, timeout=15)
+        }, timeout=15, pause=0.3)
         resp.raise_for_status()
         data = resp.json()
 
@@ -166,10 +215,11 @@ def fetch_race_day_weather(lat: float, lon: float, date: str) -> dict | None:
         return None
 
 
-def get_elevation(lat: float, lon: float) -> float | None:
+def get_elevation(lat: float, lon: float, session=requests) -> float | None:
     """Get elevation from Open-Meteo."""
     try:
-        resp = requests.get(ELEVATION_URL, params={"latitude": lat, "longitude": lon}, timeout=10)
+        resp = _paced_get(session, ELEVATION_URL, params={"latitude": lat, "longitude": lon},
+                          timeout=10, pause=0.2)
         resp.raise_for_status()
         elev = resp.json().get("elevation", [None])
         return elev[0] if elev else None
@@ -182,6 +232,11 @@ def main():
     print("✅ Connected to MongoDB")
     print("\nFetching race-day air density data...")
 
+    # Indexes first, so every upsert predicate below is an index seek (an
+    # empty collection would otherwise get them only after the bulk write)
+    db["race_air_density"].create_index([("year", 1), ("race", 1)], unique=True)
+    db["race_air_density"].create_index("circuit_slug")
+
     # Get unique (Year, Race) from fastf1_laps to find race dates
     # Use fastf1_weather for actual race dates (has Time field)
     race_dates_pipeline = [
@@ -206,19 +261,29 @@ def main():
 
     # Check existing
     existing = set()
-    for doc in db["race_air_density"].find({}, {"year": 1, "race": 1, "_id": 0}):
+    for doc in db["race_air_density"].find({}, {"year": 1, "race": 1, "_id": 0}).batch_size(5000):
         existing.add((doc.get("year"), doc.get("race")))
 
-    # Fetch elevation per circuit (once)
+    session = http_session()
+
+    # Fetch elevation per circuit (once); circuits stored by an earlier run
+    # already carry it, looked up from the same coordinates
     elevations = {}
+    for doc in db["race_air_density"].find(
+        {"elevation_m": {"$ne": None}},
+        {"circuit_slug": 1, "elevation_m": 1, "_id": 0},
+    ):
+        elevations[doc["circuit_slug"]] = doc["elevation_m"]
     for slug, (lat, lon) in CIRCUIT_COORDS.items():
-        elev = get_elevation(lat, lon)
+        if slug in elevations:
+            continue
+        elev = get_elevation(lat, lon, session)
         if elev is not None:
             elevations[slug] = elev
-        time.sleep(0.2)
     print(f"  Fetched elevations for {len(elevations)} circuits")
 
     ops = []
+    pending = []
     now = datetime.now(timezone.utc)
     fetched = 0
 
@@ -258,11 +323,7 @@ def main():
         if not date_str:
             continue
 
-        weather = fetch_race_day_weather(lat, lon, date_str)
-        if not weather:
-            continue
-
-        doc = {
+        pending.append({
             "year": year,
             "race": race,
             "circuit_slug": slug,
@@ -270,26 +331,32 @@ def main():
             "latitude": lat,
             "longitude": lon,
             "elevation_m": elevations.get(slug),
-            **weather,
-            "ingested_at": now,
-        }
-
-        ops.append(UpdateOne(
-            {"year": year, "race": race},
-            {"$set": doc},
-            upsert=True,
-        ))
-        fetched += 1
-
-        if fetched % 10 == 0:
-            print(f"  Fetched {fetched} race-day conditions...")
-            time.sleep(1)  # Rate limit
-        else:
-            time.sleep(0.3)
+        })
+
+    # Weather calls overlap on a small thread pool; _paced_get still spaces
+    # the network requests themselves across threads
+    with ThreadPoolExecutor(max_workers=WEATHER_WORKERS) as executor:
+        results = executor.map(
+            lambda d: fetch_race_day_weather(d["latitude"], d["longitude"], d["race_date"], session),
+            pending,
+        )
+        for doc, weather in zip(pending, results):
+            if not weather:
+                continue
+
+            doc.update(weather)
+            doc["ingested_at"] = now
+            ops.append(UpdateOne(
+                {"year": doc["year"], "race": doc["race"]},
+                {"$set": doc},
+                upsert=True,
+            ))
+            fetched += 1
+
+            if fetched % 10 == 0:
+                print(f"  Fetched {fetched} race-day conditions...")
 
     if ops:
-        db["race_air_density"].create_index([("year", 1), ("race", 1)], unique=True)
-        db["race_air_density"].create_index("circuit_slug")
         result = db["race_air_density"].bulk_write(ops, ordered=False)
         count = result.upserted_count + result.modified_count
         print(f"\n  ✅ Upserted {count} race-day air density records")
@@ -19,6 +19,7 @@ import time
 from datetime import datetime, timezone
 from pathlib import Path
 
+import numpy as np
 import requests
 from pymongo import UpdateOne
 
@@ -109,30 +110,27 @@ def compute_track_stats(coords: list) -> dict:
     if not coords or len(coords) < 2:
         return {}
 
-    total_length_m = 0
-    lats, lons = [], []
+    # (lon, lat) pairs; GeoJSON positions may carry a third altitude value
+    points = np.array([(c[0], c[1]) for c in coords], dtype=np.float64)
+    lons, lats = points[:, 0], points[:, 1]
 
-    for i in range(len(coords) - 1):
-        lon1, lat1 = coords[i][0], coords[i][1]
-        lon2, lat2 = coords[i + 1][0], coords[i + 1][1]
-        lats.extend([lat1, lat2])
-        lons.extend([lon1, lon2])
+    # Haversine distance of every segment at once
+    lat1, lat2 = np.radians(lats[:-1]), np.radians(lats[1:])
+    dlat = np.radians(lats[1:] - lats[:-1])
+    dlon = np.radians(lons[1:] - lons[:-1])
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    total_length_m = float((6371000 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))).sum())
 
-        # Haversine distance
-        dlat = math.radians(lat2 - lat1)
-        dlon = math.radians(lon2 - lon1)
-        a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
-        total_length_m += 6371000 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-    centroid_lat = sum(lats) / len(lats)
-    centroid_lon = sum(lons) / len(lons)
+    # Centroid over segment endpoints (interior points count twice)
+    centroid_lat = float((lats[:-1].sum() + lats[1:].sum()) / (2 * (len(lats) - 1)))
+    centroid_lon = float((lons[:-1].sum() + lons[1:].sum()) / (2 * (len(lons) - 1)))
 
     return {
         "computed_length_m": round(total_length_m),
         "centroid": [round(centroid_lon, 6), round(centroid_lat, 6)],
         "bbox": [
-            round(min(lons), 6), round(min(lats), 6),
-            round(max(lons), 6), round(max(lats), 6),
+            round(float(lons.min()), 6), round(float(lats.min()), 6),
+            round(float(lons.max()), 6), round(float(lats.max()), 6),
         ],
         "coordinate_count": len(coords),
     }
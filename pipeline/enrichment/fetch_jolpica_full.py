@@ -23,13 +23,20 @@ Usage:
 from __future__ import annotations
 
 import sys
+import threading
 import time
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
 
+import pandas as pd
 import requests
 from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from pymongo.write_concern import WriteConcern
+from requests.adapters import HTTPAdapter
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 from updater._db import get_db
@@ -37,17 +44,129 @@ from updater._db import get_db
 BASE_URL = "https://api.jolpi.ca/ergast/f1"
 YEARS = list(range(2018, 2026))
 
+# Concurrent API requests (seasons, pit-stop rounds)
+API_WORKERS = 8
+# Jolpica allows bursts of 4 requests/s and 500 requests/hour
+API_INTERVAL = 0.25
+API_WINDOW_S = 3600
+API_WINDOW_MAX = 500
+# Pause for the window to slide once the server reports this few requests left
+API_REMAINING_THRESHOLD = 1
+
+# Documents per insert_many batch in the ingest functions
+INSERT_BATCH = 1000
+
 
 # ── API helpers ──────────────────────────────────────────────────────────
 
+def _retry_after_s(value: str | None) -> float | None:
+    """Parse a Retry-After header (delta-seconds or HTTP date) into seconds."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class RateLimiter:
+    """Proactive Jolpica rate limiting shared by every fetch thread.
+
+    Request starts are spaced `min_interval` apart and capped at `max_requests`
+    per sliding `window` seconds. Retry-After and X-RateLimit-Remaining headers
+    push the next start back. The number of requests in flight follows AIMD:
+    +0.5 per successful response, halved on 429/5xx.
+    """
+
+    def __init__(self, max_requests: int, window: float, min_interval: float,
+                 max_concurrency: int, min_concurrency: int = 1,
+                 remaining_threshold: int = 1):
+        self.max_requests = max_requests
+        self.window = window
+        self.min_interval = min_interval
+        self.max_concurrency = float(max_concurrency)
+        self.min_concurrency = float(min_concurrency)
+        self.remaining_threshold = remaining_threshold
+        self.concurrency = float(max_concurrency)
+        self._starts: deque[float] = deque()
+        self._next_start = 0.0
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def wait_if_throttled(self) -> None:
+        """Block until a request may start, then count it as in flight."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._starts and self._starts[0] <= now - self.window:
+                    self._starts.popleft()
+                if self._in_flight >= int(self.concurrency):
+                    self._cond.wait()
+                    continue
+                wait = self._next_start - now
+                if len(self._starts) >= self.max_requests:
+                    wait = max(wait, self._starts[0] + self.window - now)
+                if wait <= 0:
+                    break
+                self._cond.wait(wait)
+            self._starts.append(now)
+            self._next_start = now + self.min_interval
+            self._in_flight += 1
+
+    def record(self, resp: requests.Response | None, backoff: float = 0.0) -> float:
+        """Release a request's slot and adapt to its response.
+
+        `backoff` is the pause applied on a 429 without Retry-After. Returns
+        the seconds until the next request may start.
+        """
+        with self._cond:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if resp is not None:
+                status = resp.status_code
+                if status == 429 or status >= 500:
+                    self.concurrency = max(self.min_concurrency, self.concurrency * 0.5)
+                elif status < 300:
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 0.5)
+
+                pause = _retry_after_s(resp.headers.get("Retry-After"))
+                if pause is None and status == 429:
+                    pause = backoff
+                if pause is not None:
+                    self._next_start = max(self._next_start, now + pause)
+
+                remaining = resp.headers.get("X-RateLimit-Remaining")
+                if (remaining is not None and remaining.isdigit()
+                        and int(remaining) <= self.remaining_threshold and self._starts):
+                    self._next_start = max(self._next_start, self._starts[0] + self.window)
+            self._cond.notify_all()
+            return max(0.0, self._next_start - now)
+
+
+_limiter = RateLimiter(API_WINDOW_MAX, API_WINDOW_S, API_INTERVAL, API_WORKERS,
+                       remaining_threshold=API_REMAINING_THRESHOLD)
+
+_http = requests.Session()
+_http.mount("https://", HTTPAdapter(pool_maxsize=API_WORKERS))
+
+
 def _api_get(url: str, params: dict | None = None, retries: int = 3) -> dict:
-    """GET with retry on 429."""
+    """GET through the shared rate limiter, with retry on 429."""
     for attempt in range(retries):
-        resp = requests.get(url, params=params, timeout=30)
+        _limiter.wait_if_throttled()
+        try:
+            resp = _http.get(url, params=params, timeout=30)
+        except requests.RequestException:
+            _limiter.record(None)
+            raise
+        wait = _limiter.record(resp, backoff=10 * (attempt + 1))
         if resp.status_code == 429:
-            wait = 10 * (attempt + 1)
-            print(f"    ⏳ Rate limited, waiting {wait}s...")
-            time.sleep(wait)
+            print(f"    ⏳ Rate limited, waiting {wait:.0f}s...")
             continue
         resp.raise_for_status()
         return resp.json()
@@ -69,28 +188,87 @@ def _paginate(url: str, limit: int = 100) -> list[dict]:
         offset += limit
         if offset >= total:
             break
-        time.sleep(1.5)
     return all_races
 
 
+def _fetch_concurrently(fetch, keys: list) -> dict:
+    """Run fetch(key) for every key on a thread pool; results keyed in input order."""
+    with ThreadPoolExecutor(max_workers=API_WORKERS) as executor:
+        return dict(zip(keys, executor.map(fetch, keys)))
+
+
+def _existing_rounds(db, col: str) -> set[tuple[int, int]]:
+    """(season, round) pairs already stored in `col`, grouped server-side."""
+    pipeline = [{"$group": {"_id": {"s": "$season", "r": "$round"}}}]
+    return {(d["_id"]["s"], d["_id"]["r"]) for d in db[col].aggregate(pipeline)}
+
+
+# Unique keys the server dedups ingests on; built before any inserts
+DEDUP_INDEXES = {
+    "jolpica_race_results": [("season", 1), ("round", 1), ("driver_id", 1)],
+    "jolpica_qualifying": [("season", 1), ("round", 1), ("driver_id", 1)],
+    "jolpica_sprint_results": [("season", 1), ("round", 1), ("driver_id", 1)],
+}
+
+
+def ensure_indexes(db) -> None:
+    """Create the unique dedup indexes up front (no-op when they exist)."""
+    for col, keys in DEDUP_INDEXES.items():
+        db[col].create_index(keys, unique=True)
+
+
+class BulkWriter:
+    """Buffers documents for one collection and inserts them in unordered batches.
+
+    Duplicate-key rejections (code 11000) from the unique indexes are expected
+    on re-runs and skipped; `inserted` counts the documents actually written.
+    """
+
+    def __init__(self, col, batch: int = INSERT_BATCH):
+        self.col = col.with_options(write_concern=WriteConcern(w=1))
+        self.batch = batch
+        self.buf: list[dict] = []
+        self.inserted = 0
+
+    def add(self, doc: dict) -> None:
+        self.buf.append(doc)
+        if len(self.buf) >= self.batch:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.buf:
+            return
+        try:
+            self.inserted += len(self.col.insert_many(self.buf, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            details = e.details
+            if details.get("writeConcernErrors") or any(
+                err.get("code") != 11000 for err in details.get("writeErrors", [])
+            ):
+                raise
+            self.inserted += details.get("nInserted", 0)
+        self.buf = []
+
+
 # ── 1. Race Results ─────────────────────────────────────────────────────
 
 def ingest_race_results(db) -> int:
     print("\n[1/5] Fetching full-grid race results...")
 
-    existing_keys = set()
-    for doc in db["jolpica_race_results"].find({}, {"season": 1, "round": 1, "_id": 0}):
-        existing_keys.add((doc["season"], doc["round"]))
+    existing_keys = _existing_rounds(db, "jolpica_race_results")
 
     total = 0
     now = datetime.now(timezone.utc)
+    writer = BulkWriter(db["jolpica_race_results"])
+
+    races_by_year = _fetch_concurrently(lambda year: _paginate(f"{BASE_URL}/{year}/results/"), YEARS)
 
     for year in YEARS:
-        races = _paginate(f"{BASE_URL}/{year}/results/")
+        races = races_by_year[year]
         if not races:
             continue
 
-        docs = []
+        before = writer.inserted
         for race in races:
             season = int(race["season"])
             rnd = int(race["round"])
@@ -139,15 +317,13 @@ def ingest_race_results(db) -> int:
                     "positions_gained": (grid - pos) if grid and pos else None,
                     "ingested_at": now,
                 }
-                docs.append(doc)
+                writer.add(doc)
 
-        if docs:
-            db["jolpica_race_results"].insert_many(docs)
-            total += len(docs)
-        print(f"  {year}: {len(docs)} results")
-        time.sleep(0.5)
+        writer.flush()
+        count = writer.inserted - before
+        total += count
+        print(f"  {year}: {count} results")
 
-    db["jolpica_race_results"].create_index([("season", 1), ("round", 1), ("driver_id", 1)], unique=True)
     db["jolpica_race_results"].create_index("driver_id")
     db["jolpica_race_results"].create_index("circuit_id")
     db["jolpica_race_results"].create_index("constructor_id")
@@ -160,19 +336,20 @@ def ingest_race_results(db) -> int:
 def ingest_qualifying(db) -> int:
     print("\n[2/5] Fetching qualifying results...")
 
-    existing_keys = set()
-    for doc in db["jolpica_qualifying"].find({}, {"season": 1, "round": 1, "_id": 0}):
-        existing_keys.add((doc["season"], doc["round"]))
+    existing_keys = _existing_rounds(db, "jolpica_qualifying")
 
     total = 0
     now = datetime.now(timezone.utc)
+    writer = BulkWriter(db["jolpica_qualifying"])
+
+    races_by_year = _fetch_concurrently(lambda year: _paginate(f"{BASE_URL}/{year}/qualifying/"), YEARS)
 
     for year in YEARS:
-        races = _paginate(f"{BASE_URL}/{year}/qualifying/")
+        races = races_by_year[year]
         if not races:
             continue
 
-        docs = []
+        before = writer.inserted
         for race in races:
             season = int(race["season"])
             rnd = int(race["round"])
@@ -199,15 +376,13 @@ def ingest_qualifying(db) -> int:
                     "q3": res.get("Q3"),
                     "ingested_at": now,
                 }
-                docs.append(doc)
+                writer.add(doc)
 
-        if docs:
-            db["jolpica_qualifying"].insert_many(docs)
-            total += len(docs)
-        print(f"  {year}: {len(docs)} qualifying entries")
-        time.sleep(0.5)
+        writer.flush()
+        count = writer.inserted - before
+        total += count
+        print(f"  {year}: {count} qualifying entries")
 
-    db["jolpica_qualifying"].create_index([("season", 1), ("round", 1), ("driver_id", 1)], unique=True)
     db["jolpica_qualifying"].create_index("driver_id")
     print(f"  Inserted {total} qualifying records")
     return total
@@ -218,13 +393,12 @@ def ingest_qualifying(db) -> int:
 def ingest_pit_stops(db) -> int:
     print("\n[3/5] Fetching pit stop data...")
 
-    existing_keys = set()
-    for doc in db["jolpica_pit_stops"].find({}, {"season": 1, "round": 1, "_id": 0}):
-        existing_keys.add((doc["season"], doc["round"]))
+    existing_keys = _existing_rounds(db, "jolpica_pit_stops")
 
     # First get all race rounds per year
     total = 0
     now = datetime.now(timezone.utc)
+    writer = BulkWriter(db["jolpica_pit_stops"])
 
     # Get all race rounds from already-ingested race results
     round_pipeline = [
@@ -236,23 +410,32 @@ def ingest_pit_stops(db) -> int:
     for r in all_rounds:
         rounds_by_year[r["_id"]["season"]].append(r["_id"]["round"])
 
+    def fetch_round(key):
+        year, rnd = key
+        try:
+            data = _api_get(f"{BASE_URL}/{year}/{rnd}/pitstops/", params={"limit": 100})
+            return data.get("MRData", {}).get("RaceTable", {}).get("Races", [])
+        except Exception as e:
+            print(f"    ⚠ {year} R{rnd}: {e}")
+            return []
+
+    # Every missing round across all seasons is fetched in one concurrent batch
+    pending = [
+        (year, rnd)
+        for year in YEARS
+        for rnd in sorted(rounds_by_year.get(year, []))
+        if (year, rnd) not in existing_keys
+    ]
+    pit_races_by_round = _fetch_concurrently(fetch_round, pending)
+
     for year in YEARS:
         rounds = sorted(rounds_by_year.get(year, []))
         if not rounds:
             continue
 
-        year_docs = []
+        before = writer.inserted
         for rnd in rounds:
-            if (year, rnd) in existing_keys:
-                continue
-
-            try:
-                data = _api_get(f"{BASE_URL}/{year}/{rnd}/pitstops/", params={"limit": 100})
-                pit_races = data.get("MRData", {}).get("RaceTable", {}).get("Races", [])
-            except Exception as e:
-                print(f"    ⚠ {year} R{rnd}: {e}")
-                continue
-
+            pit_races = pit_races_by_round.get((year, rnd))
             if not pit_races:
                 continue
 
@@ -278,14 +461,12 @@ def ingest_pit_stops(db) -> int:
                     "time_of_day": pit.get("time"),
                     "ingested_at": now,
                 }
-                year_docs.append(doc)
+                writer.add(doc)
 
-            time.sleep(1.5)
-
-        if year_docs:
-            db["jolpica_pit_stops"].insert_many(year_docs)
-            total += len(year_docs)
-        print(f"  {year}: {len(year_docs)} pit stops across {len(rounds)} races")
+        writer.flush()
+        count = writer.inserted - before
+        total += count
+        print(f"  {year}: {count} pit stops across {len(rounds)} races")
 
     db["jolpica_pit_stops"].create_index([("season", 1), ("round", 1), ("driver_id", 1), ("stop", 1)])
     db["jolpica_pit_stops"].create_index("circuit_id")
@@ -299,23 +480,22 @@ def ingest_pit_stops(db) -> int:
 def ingest_sprints(db) -> int:
     print("\n[4/5] Fetching sprint results...")
 
-    existing_keys = set()
-    for doc in db["jolpica_sprint_results"].find({}, {"season": 1, "round": 1, "_id": 0}):
-        existing_keys.add((doc["season"], doc["round"]))
+    existing_keys = _existing_rounds(db, "jolpica_sprint_results")
 
     total = 0
     now = datetime.now(timezone.utc)
+    writer = BulkWriter(db["jolpica_sprint_results"])
 
-    for year in YEARS:
-        if year < 2021:
-            continue  # Sprints started in 2021
+    sprint_years = [year for year in YEARS if year >= 2021]  # Sprints started in 2021
+    races_by_year = _fetch_concurrently(lambda year: _paginate(f"{BASE_URL}/{year}/sprint/"), sprint_years)
 
-        races = _paginate(f"{BASE_URL}/{year}/sprint/")
+    for year in sprint_years:
+        races = races_by_year[year]
         if not races:
             print(f"  {year}: no sprint data")
             continue
 
-        docs = []
+        before = writer.inserted
         for race in races:
             season = int(race["season"])
             rnd = int(race["round"])
@@ -354,15 +534,13 @@ def ingest_sprints(db) -> int:
                     "positions_gained": (grid - pos) if grid and pos else None,
                     "ingested_at": now,
                 }
-                docs.append(doc)
+                writer.add(doc)
 
-        if docs:
-            db["jolpica_sprint_results"].insert_many(docs)
-            total += len(docs)
-        print(f"  {year}: {len(docs)} sprint entries")
-        time.sleep(0.5)
+        writer.flush()
+        count = writer.inserted - before
+        total += count
+        print(f"  {year}: {count} sprint entries")
 
-    db["jolpica_sprint_results"].create_index([("season", 1), ("round", 1), ("driver_id", 1)], unique=True)
     db["jolpica_sprint_results"].create_index("driver_id")
     print(f"  Inserted {total} sprint records")
     return total
@@ -382,13 +560,7 @@ def ingest_constructor_standings(db) -> int:
             continue
 
         try:
-            resp = requests.get(
-                f"{BASE_URL}/{year}/constructorStandings/",
-                params={"limit": 100},
-                timeout=30,
-            )
-            resp.raise_for_status()
-            data = resp.json()
+            data = _api_get(f"{BASE_URL}/{year}/constructorStandings/", params={"limit": 100})
             standings_lists = data["MRData"]["StandingsTable"]["StandingsLists"]
         except Exception as e:
             print(f"  {year}: ⚠ {e}")
@@ -416,7 +588,6 @@ def ingest_constructor_standings(db) -> int:
             db["jolpica_constructor_standings"].insert_many(docs)
             total += len(docs)
         print(f"  {year}: {len(docs)} constructor standings")
-        time.sleep(0.5)
 
     db["jolpica_constructor_standings"].create_index([("season", 1), ("constructor_id", 1)], unique=True)
     print(f"  Inserted {total} constructor standing records")
@@ -435,13 +606,7 @@ def ingest_driver_standings(db) -> int:
             continue
 
         try:
-            resp = requests.get(
-                f"{BASE_URL}/{year}/driverStandings/",
-                params={"limit": 100},
-                timeout=30,
-            )
-            resp.raise_for_status()
-            data = resp.json()
+            data = _api_get(f"{BASE_URL}/{year}/driverStandings/", params={"limit": 100})
             standings_lists = data["MRData"]["StandingsTable"]["StandingsLists"]
         except Exception as e:
             print(f"  {year}: ⚠ {e}")
@@ -475,7 +640,6 @@ def ingest_driver_standings(db) -> int:
             db["jolpica_driver_standings"].insert_many(docs)
             total += len(docs)
         print(f"  {year}: {len(docs)} driver standings")
-        time.sleep(0.5)
 
     db["jolpica_driver_standings"].create_index([("season", 1), ("driver_id", 1)], unique=True)
     db["jolpica_driver_standings"].create_index("driver_code")
@@ -498,6 +662,40 @@ def _parse_laptime_s(t: str | None) -> float | None:
         return None
 
 
+FINISHED_STATUSES = ("Finished", "+1 Lap", "+2 Laps", "+3 Laps")
+
+QUALI_FIELDS = ["season", "round", "driver_id", "q1", "q2", "q3"]
+RACE_FIELDS = ["season", "round", "driver_id", "fastest_lap_time",
+               "position", "grid", "constructor_id", "points", "status"]
+SPRINT_FIELDS = ["driver_id", "position", "grid", "positions_gained", "points"]
+
+
+def _load_frame(col, fields: list[str], driver_ids: set[str] | None = None) -> pd.DataFrame:
+    """Projected documents as a DataFrame with one column per field, even if absent.
+
+    The whole collection is streamed; rows are narrowed to `driver_ids`
+    client-side rather than with a large `$in` query. Values go straight
+    into per-field lists, so decoded documents are never all held at once.
+    """
+    columns = {f: [] for f in fields}
+    for doc in col.find({}, {"_id": 0, **{f: 1 for f in fields}}).batch_size(5000):
+        if driver_ids is not None and doc.get("driver_id") not in driver_ids:
+            continue
+        for f, values in columns.items():
+            values.append(doc.get(f))
+    return pd.DataFrame(columns, columns=fields)
+
+
+def _laptime_s(times: pd.Series) -> pd.Series:
+    """_parse_laptime_s over a column; NaN where missing or unparseable."""
+    return times.map(_parse_laptime_s, na_action="ignore").astype(float)
+
+
+def _nonzero(values: pd.Series) -> pd.Series:
+    """Mask of values that are present and non-zero (the old truthiness checks)."""
+    return values.notna() & values.ne(0)
+
+
 def compute_derived_metrics(db):
     """Compute and patch derived metrics into opponent_profiles."""
     print("\n[Derived] Computing enriched metrics...")
@@ -511,98 +709,62 @@ def compute_derived_metrics(db):
 
     # ── 1. Quali vs Race pace delta ──────────────────────────────────
     print("  Computing quali-race deltas...")
-    quali_docs = list(db["jolpica_qualifying"].find(
-        {"driver_id": {"$in": list(driver_ids)}},
-        {"_id": 0, "season": 1, "round": 1, "driver_id": 1, "q1": 1, "q2": 1, "q3": 1},
-    ))
-    race_docs = list(db["jolpica_race_results"].find(
-        {"driver_id": {"$in": list(driver_ids)}},
-        {"_id": 0, "season": 1, "round": 1, "driver_id": 1, "fastest_lap_time": 1,
-         "position": 1, "grid": 1, "constructor_id": 1, "points": 1, "status": 1},
-    ))
-
-    # Index race docs by (season, round, driver_id)
-    race_index = {}
-    for rd in race_docs:
-        key = (rd["season"], rd["round"], rd["driver_id"])
-        race_index[key] = rd
-
-    # Per-driver quali-race delta
-    driver_deltas = defaultdict(list)
-    driver_q_positions = defaultdict(list)
-
-    for qd in quali_docs:
-        did = qd["driver_id"]
-        best_q = None
-        for q_field in ["q3", "q2", "q1"]:
-            t = _parse_laptime_s(qd.get(q_field))
-            if t:
-                best_q = t
-                break
-
-        key = (qd["season"], qd["round"], did)
-        rd = race_index.get(key)
-        if rd and best_q:
-            fl = _parse_laptime_s(rd.get("fastest_lap_time"))
-            if fl and fl > 0 and best_q > 0:
-                delta_pct = ((fl - best_q) / best_q) * 100
-                driver_deltas[did].append(delta_pct)
+    quali = _load_frame(db["jolpica_qualifying"], QUALI_FIELDS, driver_ids)
+    races = _load_frame(db["jolpica_race_results"], RACE_FIELDS, driver_ids)
+
+    # Best session time: Q3 if set, else Q2, else Q1
+    best_q = pd.Series(float("nan"), index=quali.index)
+    for q_field in ["q1", "q2", "q3"]:
+        t = _laptime_s(quali[q_field])
+        best_q = best_q.mask(_nonzero(t), t)
+    quali["best_q"] = best_q
+    races["fl_s"] = _laptime_s(races["fastest_lap_time"])
+
+    paired = quali[["season", "round", "driver_id", "best_q"]].merge(
+        races[["season", "round", "driver_id", "fl_s"]],
+        on=["season", "round", "driver_id"],
+    )
+    paired = paired[(paired["fl_s"] > 0) & (paired["best_q"] > 0)]
+    paired["delta_pct"] = ((paired["fl_s"] - paired["best_q"]) / paired["best_q"]) * 100
+    driver_deltas = paired.groupby("driver_id")["delta_pct"].mean().to_dict()
 
     # ── 2. Constructor-adjusted performance ──────────────────────────
     print("  Computing constructor-adjusted performance...")
     # Get constructor position per season
-    constructor_rank = {}
-    for doc in db["jolpica_constructor_standings"].find(
-        {}, {"season": 1, "constructor_id": 1, "position": 1, "_id": 0}
-    ):
-        constructor_rank[(doc["season"], doc["constructor_id"])] = doc["position"]
+    standings = _load_frame(
+        db["jolpica_constructor_standings"], ["season", "constructor_id", "position"],
+    ).rename(columns={"position": "car_rank"})
+    races = races.merge(standings, on=["season", "constructor_id"], how="left")
 
+    pos, grid = races["position"], races["grid"]
     # Per-driver: average (finish_pos - constructor_rank) = how much better/worse than car
-    driver_car_adj = defaultdict(list)
-    driver_grid_vs_finish = defaultdict(list)
-    driver_points = defaultdict(lambda: {"points": 0, "races": 0, "dnfs": 0})
-    driver_status = defaultdict(list)
-
-    for rd in race_docs:
-        did = rd["driver_id"]
-        pos = rd.get("position")
-        grid = rd.get("grid")
-        cid = rd.get("constructor_id")
-        season = rd["season"]
-
-        if pos and cid:
-            car_rank = constructor_rank.get((season, cid))
-            if car_rank:
-                # Negative = outperforming car, positive = underperforming
-                driver_car_adj[did].append(pos - car_rank)
-
-        if grid and pos:
-            driver_grid_vs_finish[did].append(grid - pos)
-
-        dp = driver_points[did]
-        dp["races"] += 1
-        dp["points"] += rd.get("points", 0)
-        status = rd.get("status", "")
-        if status and status not in ("Finished", "+1 Lap", "+2 Laps", "+3 Laps"):
-            dp["dnfs"] += 1
+    # Negative = outperforming car, positive = underperforming
+    has_car = _nonzero(pos) & races["constructor_id"].notna() & races["constructor_id"].ne("") & _nonzero(races["car_rank"])
+    races["car_adj"] = (pos - races["car_rank"]).where(has_car)
+    races["grid_gain"] = (grid - pos).where(_nonzero(grid) & _nonzero(pos))
+    status = races["status"]
+    races["dnf"] = status.notna() & status.ne("") & ~status.isin(FINISHED_STATUSES)
+    races["points"] = races["points"].fillna(0)
+
+    race_stats = races.groupby("driver_id").agg(
+        races=("points", "size"),
+        points=("points", "sum"),
+        dnfs=("dnf", "sum"),
+        car_adj=("car_adj", "mean"),
+        grid_gain=("grid_gain", "mean"),
+    ).to_dict("index")
 
     # ── 3. Sprint stats ─────────────────────────────────────────────
     print("  Computing sprint performance...")
-    sprint_docs = list(db["jolpica_sprint_results"].find(
-        {"driver_id": {"$in": list(driver_ids)}},
-        {"_id": 0, "driver_id": 1, "position": 1, "grid": 1, "positions_gained": 1, "points": 1},
-    ))
-
-    driver_sprint = defaultdict(lambda: {"races": 0, "positions": [], "gained": [], "points": 0})
-    for sd in sprint_docs:
-        did = sd["driver_id"]
-        ds = driver_sprint[did]
-        ds["races"] += 1
-        if sd.get("position"):
-            ds["positions"].append(sd["position"])
-        if sd.get("positions_gained") is not None:
-            ds["gained"].append(sd["positions_gained"])
-        ds["points"] += sd.get("points", 0)
+    sprints = _load_frame(db["jolpica_sprint_results"], SPRINT_FIELDS, driver_ids)
+    sprints["finish"] = sprints["position"].where(_nonzero(sprints["position"]))
+    sprints["points"] = sprints["points"].fillna(0)
+    sprint_stats = sprints.groupby("driver_id").agg(
+        races=("points", "size"),
+        finish=("finish", "mean"),
+        gained=("positions_gained", "mean"),
+        points=("points", "sum"),
+    ).to_dict("index")
 
     # ── Build patches ────────────────────────────────────────────────
     print("  Patching opponent_profiles...")
@@ -613,34 +775,32 @@ def compute_derived_metrics(db):
         patch = {}
 
         # Quali-race delta
-        deltas = driver_deltas.get(did, [])
-        if deltas:
-            patch["quali_race_pace_delta_pct"] = round(sum(deltas) / len(deltas), 3)
-
-        # Constructor-adjusted
-        adj = driver_car_adj.get(did, [])
-        if adj:
-            patch["constructor_adjusted_finish"] = round(sum(adj) / len(adj), 2)
-
-        # Full-grid career stats (more complete than current)
-        dp = driver_points.get(did)
-        if dp and dp["races"] > 0:
-            patch["jolpica_total_races"] = dp["races"]
-            patch["jolpica_avg_points_per_race"] = round(dp["points"] / dp["races"], 2)
-            patch["jolpica_dnf_rate"] = round(dp["dnfs"] / dp["races"], 4)
-
-        # Grid vs finish
-        gvf = driver_grid_vs_finish.get(did, [])
-        if gvf:
-            patch["avg_positions_gained_jolpica"] = round(sum(gvf) / len(gvf), 2)
+        delta = driver_deltas.get(did)
+        if delta is not None:
+            patch["quali_race_pace_delta_pct"] = round(delta, 3)
+
+        rs = race_stats.get(did)
+        if rs:
+            # Constructor-adjusted
+            if pd.notna(rs["car_adj"]):
+                patch["constructor_adjusted_finish"] = round(rs["car_adj"], 2)
+
+            # Full-grid career stats (more complete than current)
+            patch["jolpica_total_races"] = int(rs["races"])
+            patch["jolpica_avg_points_per_race"] = round(rs["points"] / rs["races"], 2)
+            patch["jolpica_dnf_rate"] = round(int(rs["dnfs"]) / rs["races"], 4)
+
+            # Grid vs finish
+            if pd.notna(rs["grid_gain"]):
+                patch["avg_positions_gained_jolpica"] = round(rs["grid_gain"], 2)
 
         # Sprint
-        ds = driver_sprint.get(did)
-        if ds and ds["races"] > 0:
-            patch["sprint_races"] = ds["races"]
-            patch["sprint_avg_finish"] = round(sum(ds["positions"]) / len(ds["positions"]), 2) if ds["positions"] else None
-            patch["sprint_avg_gained"] = round(sum(ds["gained"]) / len(ds["gained"]), 2) if ds["gained"] else None
-            patch["sprint_points"] = ds["points"]
+        ss = sprint_stats.get(did)
+        if ss:
+            patch["sprint_races"] = int(ss["races"])
+            patch["sprint_avg_finish"] = round(ss["finish"], 2) if pd.notna(ss["finish"]) else None
+            patch["sprint_avg_gained"] = round(ss["gained"], 2) if pd.notna(ss["gained"]) else None
+            patch["sprint_points"] = float(ss["points"])
 
         if patch:
             patch["jolpica_enriched_at"] = now
@@ -694,16 +854,29 @@ def expand_circuit_pit_losses(db):
         "zandvoort": "zandvoort",
     }
 
+    # Durations are sorted before grouping so each circuit's pushed array is
+    # ordered; only its middle element (upper median) leaves the server
     pipeline = [
         {"$match": {"duration_s": {"$ne": None, "$gt": 0, "$lt": 120}}},
+        {"$sort": {"duration_s": 1}},
         {"$group": {
             "_id": "$circuit_id",
             "avg_duration_s": {"$avg": "$duration_s"},
-            "median_values": {"$push": "$duration_s"},
+            "sorted_values": {"$push": "$duration_s"},
             "sample_count": {"$sum": 1},
             "min_duration_s": {"$min": "$duration_s"},
             "max_duration_s": {"$max": "$duration_s"},
         }},
+        {"$project": {
+            "avg_duration_s": 1,
+            "median_duration_s": {"$arrayElemAt": [
+                "$sorted_values",
+                {"$toInt": {"$floor": {"$divide": ["$sample_count", 2]}}},
+            ]},
+            "sample_count": 1,
+            "min_duration_s": 1,
+            "max_duration_s": 1,
+        }},
     ]
 
     results = list(db["jolpica_pit_stops"].aggregate(pipeline, allowDiskUse=True))
@@ -718,8 +891,7 @@ def expand_circuit_pit_losses(db):
         if not slug:
             continue
 
-        values = sorted(r["median_values"])
-        median = values[len(values) // 2] if values else None
+        median = r.get("median_duration_s")
 
         patch = {
             "jolpica_avg_pit_duration_s": round(r["avg_duration_s"], 2),
@@ -748,6 +920,7 @@ def expand_circuit_pit_losses(db):
 def main():
     db = get_db()
     print("Connected to MongoDB")
+    ensure_indexes(db)
 
     ingest_race_results(db)
     ingest_qualifying(db)
@@ -0,0 +1,43 @@
+"""vectorized_markers on drivers that only appear in the race telemetry."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "pipeline"))
+import driver_performance_markers as dpm
+
+
+@pytest.fixture(params=["polars", "pandas"])
+def markers_backend(request, monkeypatch):
+    if request.param == "polars":
+        if not dpm.POLARS_AVAILABLE:
+            pytest.skip("polars not installed")
+    else:
+        monkeypatch.setattr(dpm, "POLARS_AVAILABLE", False)
+    return request.param
+
+
+def test_telemetry_only_driver(markers_backend):
+    laps = pd.DataFrame({
+        "Driver": ["AAA"] * 10,
+        "LapTime": np.linspace(90.0, 92.0, 10),
+        "LapNumber": np.arange(1.0, 11.0),
+        "Year": [2023] * 10,
+        "Race": ["Bahrain Grand Prix"] * 10,
+    })
+    race_tel = pd.DataFrame({
+        "Driver": ["AAA", "BBB", "BBB"],
+        "Speed": [300.0, 310.0, 290.0],
+        "Throttle": [90.0, 80.0, 70.0],
+    })
+
+    markers = dpm.vectorized_markers(laps, race_tel, {})
+
+    assert markers.loc["AAA", "years_covered"] == [2023]
+    assert markers.loc["BBB", "years_covered"] == []
+    assert markers.loc["BBB", "avg_throttle_pct"] == 75.0
+    assert pd.isna(markers.loc["BBB", "total_race_laps"])